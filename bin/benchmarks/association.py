@@ -0,0 +1,191 @@
+import json
+import time
+from argparse import ArgumentParser
+from collections import defaultdict
+from os.path import join
+import numpy as np
+import pandas as pd
+
+from src.utils.cv import to_camera
+from src.reconstruction.cameras import load_cameras
+from src.reconstruction.association import affinity_matrices, n_computations
+from src.reconstruction.association import ASSOCIATION_METHODS
+from src.reconstruction.grouper import SkeletonsGrouper
+from src.utils.logger import Logger
+
+log = Logger(name='AssociationBenchmark')
+
+
+def synthetic_sample(cameras, n_people, n_joints, noise, dropout, random):
+    """
+    Random skeletons standing at least 50 units apart inside the dome, and their
+    detections on each camera, with noise, missing joints and shuffled order.
+    """
+    centers = []
+    while len(centers) < n_people:
+        center = np.array([random.uniform(-200, 200), -100.0, random.uniform(-200, 200)])
+        if all(np.linalg.norm(center - other) > 50.0 for other in centers):
+            centers.append(center)
+    people = np.stack(
+        [center + random.normal(scale=[15, 50, 15], size=(n_joints, 3)) for center in centers])
+
+    detections = {}
+    for camera_id, camera in cameras.items():
+        x = to_camera(people.reshape(-1, 3).T, camera.intrinsic(), camera.extrinsic(),
+                      camera.distortion()).T
+        x = (x + random.normal(scale=noise, size=x.shape)).reshape(n_people, n_joints, 2)
+        skeletons = np.concatenate([x, np.ones((n_people, n_joints, 1))], axis=2)
+
+        width, height = camera.resolution()
+        outside = np.logical_or.reduce(
+            [x[:, :, 0] < 0, x[:, :, 0] > width, x[:, :, 1] < 0, x[:, :, 1] > height])
+        missing = np.logical_or(outside, random.uniform(size=outside.shape) < dropout)
+        skeletons[missing] = [0.0, 0.0, -1.0]
+        visible = ~missing.all(axis=1)
+        detections[camera_id] = skeletons[visible][random.permutation(visible.sum())]
+    return people, detections
+
+
+def recovered(people, skeletons, tolerance):
+    # people with a reconstructed skeleton closer, on average, than 'tolerance'
+    n_recovered = 0
+    for person in people:
+        valid = skeletons[:, :, 3] >= 0.0
+        distances = np.linalg.norm(skeletons[:, :, 0:3] - person[np.newaxis], axis=2)
+        with np.errstate(invalid='ignore'):
+            mean = np.where(valid, distances, 0.0).sum(axis=1) / valid.sum(axis=1)
+        if np.any(mean < tolerance):
+            n_recovered += 1
+    return n_recovered
+
+
+def main(calibrations_folder, sequence, cameras_counts, people_counts, samples, noise, dropout,
+         tolerance, output_folder):
+
+    random = np.random.RandomState(0)
+    all_cameras = load_cameras(join(calibrations_folder, sequence, 'calibrations'))
+    camera_ids = sorted(all_cameras.keys())
+
+    durations = {method: defaultdict(list) for method in ASSOCIATION_METHODS}
+    results = defaultdict(list)
+    for n_cameras in cameras_counts:
+        spread = np.linspace(0, len(camera_ids) - 1, n_cameras).astype(int)
+        cameras = {camera_ids[i]: all_cameras[camera_ids[i]] for i in spread}
+        groupers = {
+            method: SkeletonsGrouper(cameras, association=method)
+            for method in ASSOCIATION_METHODS
+        }
+
+        for n_people in people_counts:
+            for _ in range(samples):
+                people, detections = synthetic_sample(cameras, n_people, 19, noise, dropout,
+                                                      random)
+                points, valid = groupers['greedy'].undistort(detections)
+                computations = n_computations(
+                    affinity_matrices(points, valid, groupers['greedy'].fundamentals()))
+
+                for method, grouper in groupers.items():
+                    started_at = time.time()
+                    skeletons = grouper.group(detections)
+                    duration = 1000.0 * (time.time() - started_at)
+
+                    durations[method][computations].append(duration)
+                    results['method'].append(method)
+                    results['cameras'].append(n_cameras)
+                    results['people'].append(n_people)
+                    results['n_computations'].append(computations)
+                    results['duration_ms'].append(duration)
+                    results['skeletons'].append(skeletons.shape[0])
+                    results['recovered'].append(recovered(people, skeletons, tolerance))
+
+    df = pd.DataFrame(data=results)
+    summary = df.groupby(['method', 'cameras', 'people']).agg({
+        'n_computations': 'mean',
+        'duration_ms': 'mean',
+        'skeletons': 'mean',
+        'recovered': 'mean',
+    })
+    print(summary.to_string())
+
+    # the JSON files keep every 'n_computations' like 'bin/metrics/grouper_duration.py',
+    # here they are summarized in ranges with roughly the same number of samples
+    edges = np.unique(np.percentile(df['n_computations'], np.linspace(0, 100, 9)).astype(int))
+    df['bucket'] = pd.cut(df['n_computations'], bins=edges, include_lowest=True)
+    print(df.pivot_table(index='bucket', columns='method', values='duration_ms',
+                         aggfunc='mean', observed=True).to_string())
+
+    if output_folder is not None:
+        df.to_csv(join(output_folder, 'association.csv'), header=True, index=False)
+        for method, method_durations in durations.items():
+            output_file_path = join(output_folder, 'association_durations_{}.json'.format(method))
+            log.info("Saving results on '{}'", output_file_path)
+            with open(output_file_path, 'w') as f:
+                json.dump(method_durations, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--calibrations-folder',
+        type=str,
+        required=False,
+        default='etc/calibrations',
+        help="""Path to folder containing a folder with the name of each sequence, and
+        inside that a 'calibrations' folder with a JSON calibration file for each camera.""")
+    parser.add_argument(
+        '--sequence',
+        type=str,
+        required=False,
+        default='160422_haggling1',
+        help="""Sequence whose calibrations are used.""")
+    parser.add_argument(
+        '--cameras-counts',
+        type=int,
+        nargs='+',
+        default=[3, 5, 10, 15, 31],
+        help="""Numbers of cameras, spread over the available ones.""")
+    parser.add_argument(
+        '--people-counts',
+        type=int,
+        nargs='+',
+        default=[2, 4, 8, 12, 16],
+        help="""Numbers of people on each synthetic sample.""")
+    parser.add_argument(
+        '--samples',
+        type=int,
+        default=20,
+        help="""Number of synthetic samples of each configuration.""")
+    parser.add_argument(
+        '--noise',
+        type=float,
+        default=2.0,
+        help="""Standard deviation, in pixels, of the noise added to the detections.""")
+    parser.add_argument(
+        '--dropout',
+        type=float,
+        default=0.1,
+        help="""Probability of a joint being missing on a camera.""")
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=10.0,
+        help="""Mean joint distance to consider a person correctly reconstructed.""")
+    parser.add_argument(
+        '--output-folder',
+        type=str,
+        required=False,
+        help="""Path to folder to save a CSV file with all measurements, and a JSON file for
+        each association method with durations keyed by the number of computations, the
+        format of 'bin.metrics.grouper_duration'.""")
+
+    args = parser.parse_args()
+    main(
+        calibrations_folder=args.calibrations_folder,
+        sequence=args.sequence,
+        cameras_counts=args.cameras_counts,
+        people_counts=args.people_counts,
+        samples=args.samples,
+        noise=args.noise,
+        dropout=args.dropout,
+        tolerance=args.tolerance,
+        output_folder=args.output_folder)
@@ -0,0 +1,118 @@
+from argparse import ArgumentParser
+from itertools import islice
+import time
+import numpy as np
+import pandas as pd
+
+from src.utils.video import VideoIterator
+from src.utils.encoding import Encoder, EncodingPool, ENCODER_BACKENDS, is_available
+from src.utils.logger import Logger
+
+log = Logger(name='EncodingBenchmark')
+
+
+def main(video_file, n_frames, begin, backends, qualities, workers, output_file):
+
+    video_iterator = VideoIterator(video_file)
+    it_range = range(begin, min(begin + n_frames, video_iterator.n_frames()))
+    frames = list(islice(video_iterator.in_range(it_range), n_frames))
+    log.info("Loaded {} frames of {}x{} from '{}'", len(frames), *video_iterator.resolution(),
+             video_file)
+
+    results = {
+        'backend': [],
+        'quality': [],
+        'encode_ms': [],
+        'payload_kb': [],
+        'pool_fps': [],
+    }
+    for backend in backends:
+        if not is_available(backend):
+            log.warn("Backend '{}' isn't available. Skipping.", backend)
+            continue
+
+        # quality doesn't change the output of the 'raw' backend
+        for quality in (qualities if backend != 'raw' else qualities[:1]):
+            encoder = Encoder(backend=backend, quality=quality)
+
+            durations, sizes = [], []
+            for frame in frames:
+                started_at = time.time()
+                data = encoder(frame)
+                durations.append(time.time() - started_at)
+                sizes.append(len(data))
+
+            pool = EncodingPool(encoder=encoder, workers=workers, processes=True)
+            # first round only warms up the pool processes
+            for _ in range(2):
+                started_at = time.time()
+                for future in [pool.submit(frame) for frame in frames]:
+                    future.result()
+                pool_fps = len(frames) / (time.time() - started_at)
+            pool.shutdown()
+
+            results['backend'].append(backend)
+            results['quality'].append(quality)
+            results['encode_ms'].append(1000.0 * np.mean(durations))
+            results['payload_kb'].append(np.mean(sizes) / 1024.0)
+            results['pool_fps'].append(pool_fps)
+
+            log.info("{} | quality={:.2f} | {:.2f} ms | {:.1f} KB | {:.1f} fps ({} workers)",
+                     backend, quality, results['encode_ms'][-1], results['payload_kb'][-1],
+                     pool_fps, workers)
+
+    df = pd.DataFrame(data=results)
+    print(df)
+    if output_file is not None:
+        df.to_csv(output_file, header=True, index=False)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--video',
+        type=str,
+        required=True,
+        help="""Path to a video file from CMU Panoptic dataset, e.g. 'hd_00_00.mp4'.""")
+    parser.add_argument(
+        '--n-frames',
+        type=int,
+        default=100,
+        help="""Number of frames used on the benchmark.""")
+    parser.add_argument(
+        '--begin',
+        type=int,
+        default=0,
+        help="""Id of the first frame used on the benchmark.""")
+    parser.add_argument(
+        '--backends',
+        type=str,
+        nargs='+',
+        default=ENCODER_BACKENDS,
+        help="""Encoder backends to evaluate. Unavailable ones will be skipped.""")
+    parser.add_argument(
+        '--qualities',
+        type=float,
+        nargs='+',
+        default=[0.5, 0.7, 0.8, 0.9],
+        help="""Encoding qualities to evaluate, from 0.0 to 1.0.""")
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=4,
+        help="""Number of processes used to measure the encoding pool throughput.""")
+    parser.add_argument(
+        '--output-file',
+        type=str,
+        required=False,
+        help="""CSV file to save the results.""")
+
+    args = parser.parse_args()
+    main(
+        video_file=args.video,
+        n_frames=args.n_frames,
+        begin=args.begin,
+        backends=args.backends,
+        qualities=args.qualities,
+        workers=args.workers,
+        output_file=args.output_file)
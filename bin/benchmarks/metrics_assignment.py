@@ -0,0 +1,93 @@
+from argparse import ArgumentParser
+from itertools import product
+import time
+import numpy as np
+import pandas as pd
+
+from src.utils.metrics import error_per_joint, possible_groups, optimal_group
+from src.utils.logger import Logger
+
+log = Logger(name='MetricsAssignmentBenchmark')
+
+
+def synthetic_sample(n_people, n_joints, random):
+    """
+    Rows of ground truth skeletons, as on '3d_annotations', and of localized skeletons
+    with noise, missing and extra people and invalid joints, shuffled.
+    """
+    centers = random.uniform(-200, 200, size=(n_people, 1, 3))
+    gt = centers + random.normal(scale=[20, 50, 20], size=(n_people, n_joints, 3))
+    n_exp = max(1, n_people + random.randint(-1, 2))
+    exp = np.concatenate([gt, gt[0:max(0, n_exp - n_people)] + 100.0])[0:n_exp]
+    exp = exp[random.permutation(n_exp)] + random.normal(scale=2.0, size=(n_exp, n_joints, 3))
+
+    def rows(skeletons, invalid_ratio):
+        joints = np.concatenate([skeletons, np.ones(skeletons.shape[0:2] + (1, ))], axis=2)
+        joints[random.uniform(size=skeletons.shape[0:2]) < invalid_ratio] = [0, 0, 0, -1]
+        ids = np.arange(skeletons.shape[0]).reshape(-1, 1)
+        return np.hstack([np.zeros_like(ids), ids, joints.reshape(skeletons.shape[0], -1)])
+
+    return rows(gt, 0.05), rows(exp, 0.2)
+
+
+def main(people_counts, samples, max_brute_force):
+
+    random = np.random.RandomState(0)
+    results = {'people': [], 'method': [], 'duration_ms': []}
+    n_differences = 0
+    for n_people, _ in product(people_counts, range(samples)):
+        gt, exp = synthetic_sample(n_people, 19, random)
+        gt_its, exp_its = list(range(gt.shape[0])), list(range(exp.shape[0]))
+        error_pairs = {(g, e): error_per_joint(gt[g], exp[e], 'joints19')
+                       for g, e in product(gt_its, exp_its)}
+
+        def group_error(group):
+            return sum(map(lambda x: np.nanmean(error_pairs[x]), group))
+
+        started_at = time.time()
+        cost = [[np.nanmean(error_pairs[(g, e)]) for e in exp_its] for g in gt_its]
+        group = optimal_group(gt_its, exp_its, cost)
+        results['people'].append(n_people)
+        results['method'].append('optimal')
+        results['duration_ms'].append(1000.0 * (time.time() - started_at))
+
+        if n_people > max_brute_force:
+            continue
+        started_at = time.time()
+        brute_force_group = min(possible_groups(gt_its, exp_its), key=group_error)
+        results['people'].append(n_people)
+        results['method'].append('brute_force')
+        results['duration_ms'].append(1000.0 * (time.time() - started_at))
+        if sorted(brute_force_group) != sorted(group):
+            n_differences += 1
+
+    df = pd.DataFrame(data=results)
+    print(df.pivot_table(index='people', columns='method', values='duration_ms',
+                         aggfunc='mean').to_string())
+    log.info("{} samples with a different group from the brute force", n_differences)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--people-counts',
+        type=int,
+        nargs='+',
+        default=[2, 3, 4, 5, 6, 7, 8, 12, 16, 24],
+        help="""Numbers of ground truth people on each synthetic sample.""")
+    parser.add_argument(
+        '--samples',
+        type=int,
+        default=10,
+        help="""Number of synthetic samples for each number of people.""")
+    parser.add_argument(
+        '--max-brute-force',
+        type=int,
+        default=7,
+        help="""Largest number of people whose groups are also searched by brute force.""")
+
+    args = parser.parse_args()
+    main(
+        people_counts=args.people_counts,
+        samples=args.samples,
+        max_brute_force=args.max_brute_force)
@@ -0,0 +1,121 @@
+from argparse import ArgumentParser
+from os.path import join, dirname, basename
+import time
+import numpy as np
+import pandas as pd
+
+from src.utils.cv import to_camera, projection_matrices, triangulate_points
+from src.reconstruction.cameras import load_cameras
+from src.utils.logger import Logger
+
+log = Logger(name='TriangulationBenchmark')
+
+
+def triangulate_loop(P, x, mask):
+    # one DLT system solved at a time, as done before the batched version
+    X = np.full((x.shape[0], 3), np.nan)
+    for n in range(x.shape[0]):
+        views = np.where(mask[n])[0]
+        if views.size < 2:
+            continue
+        A = np.vstack([[u * P[c, 2] - P[c, 0], v * P[c, 2] - P[c, 1]]
+                       for c, (u, v) in zip(views, x[n, views])])
+        solution = np.linalg.svd(A)[2][-1]
+        X[n] = solution[0:3] / solution[3]
+    return X
+
+
+def main(sequence_folder, calibrations_folder, pose_model, cameras, noise, loop_points):
+
+    sequence_name = basename(dirname(sequence_folder + '/'))
+    annotations_file_path = join(sequence_folder, '3d_annotations', pose_model, 'data.csv')
+    data = pd.read_csv(annotations_file_path).drop(['sample_id', 'person_id'], axis=1).values
+    joints = data.reshape(-1, 4)
+    valid_joints = np.logical_and(~(joints[:, 0:3] == 0.0).all(axis=1), joints[:, 3] >= 0.0)
+    X_gt = joints[valid_joints, 0:3]
+
+    calibrations = load_cameras(join(calibrations_folder, sequence_name, 'calibrations'), cameras)
+    camera_ids = sorted(calibrations.keys())
+    P = projection_matrices([calibrations[c].intrinsic() for c in camera_ids],
+                            [calibrations[c].extrinsic() for c in camera_ids])
+
+    # undistorted projections of the ground truth, observed only inside the image
+    x = np.stack([
+        to_camera(X_gt.T, calibrations[c].intrinsic(), calibrations[c].extrinsic()).T
+        for c in camera_ids
+    ], axis=1)
+    resolutions = np.array([calibrations[c].resolution() for c in camera_ids])
+    mask = np.logical_and((x >= 0.0).all(axis=2), (x <= resolutions[np.newaxis]).all(axis=2))
+    x = x + np.random.normal(scale=noise, size=x.shape)
+    log.info("{} | {} points from {} skeletons, {} cameras", sequence_name, X_gt.shape[0],
+             data.shape[0], len(camera_ids))
+
+    started_at = time.time()
+    X, reprojection_error = triangulate_points(P, x, mask, ret_error=True)
+    batched_time = time.time() - started_at
+
+    n_loop = min(loop_points, X_gt.shape[0])
+    started_at = time.time()
+    X_loop = triangulate_loop(P, x[:n_loop], mask[:n_loop])
+    loop_time = time.time() - started_at
+
+    errors = np.linalg.norm(X - X_gt, axis=1)
+    loop_errors = np.linalg.norm(X_loop - X_gt[:n_loop], axis=1)
+    batched_pps = X_gt.shape[0] / batched_time
+    loop_pps = n_loop / loop_time
+    log.info("batched: {:.3f}s, {:.0f} points/s | loop: {:.0f} points/s | speedup: {:.1f}x",
+             batched_time, batched_pps, loop_pps, batched_pps / loop_pps)
+    log.info("3D error: mean {:.3f}, median {:.3f}, loop mean {:.3f} | reprojection error: "
+             "mean {:.3f} px", np.nanmean(errors), np.nanmedian(errors),
+             np.nanmean(loop_errors), np.nanmean(reprojection_error))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--sequence-folder',
+        type=str,
+        required=True,
+        help="""Path to folder containing a sequence from CMU Panoptic dataset, with ground
+        truth on '3d_annotations/{pose_model}/data.csv'.""")
+    parser.add_argument(
+        '--calibrations-folder',
+        type=str,
+        required=False,
+        default='etc/calibrations',
+        help="""Path to folder containing a folder with the name of each sequence, and
+        inside that a 'calibrations' folder with a JSON calibration file for each camera.""")
+    parser.add_argument(
+        '--pose-model',
+        type=str,
+        required=False,
+        default='joints19',
+        help="""Pose model of the ground truth, can be either 'joints15' or 'joints19'.""")
+    parser.add_argument(
+        '--cameras',
+        type=int,
+        required=False,
+        nargs='+',
+        default=[0, 3, 7, 10, 23],
+        help="""Cameras where the ground truth is projected.""")
+    parser.add_argument(
+        '--noise',
+        type=float,
+        required=False,
+        default=1.0,
+        help="""Standard deviation, in pixels, of the noise added to the projections.""")
+    parser.add_argument(
+        '--loop-points',
+        type=int,
+        required=False,
+        default=20000,
+        help="""Number of points triangulated one at a time, to compare throughput.""")
+
+    args = parser.parse_args()
+    main(
+        sequence_folder=args.sequence_folder,
+        calibrations_folder=args.calibrations_folder,
+        pose_model=args.pose_model,
+        cameras=args.cameras,
+        noise=args.noise,
+        loop_points=args.loop_points)
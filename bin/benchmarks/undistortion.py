@@ -0,0 +1,93 @@
+from argparse import ArgumentParser
+from os import walk
+from os.path import join
+import time
+import numpy as np
+
+from src.utils.cv import to_camera
+from src.reconstruction.cameras import load_cameras
+from src.utils.logger import Logger
+
+log = Logger(name='UndistortionBenchmark')
+
+
+def distort(x, K, d):
+    # distorted image points of the undistorted (N, 2) image points 'x'
+    normalized = np.linalg.solve(K, np.vstack([x.T, np.ones(x.shape[0])]))
+    return to_camera(normalized, K, np.hstack([np.eye(3), np.zeros((3, 1))]), d).T
+
+
+def main(calibrations_folder, n_points, iterations, repeat):
+
+    _, sequences, _ = next(walk(calibrations_folder))
+    random = np.random.RandomState(0)
+    for sequence in sorted(sequences):
+        cameras = load_cameras(join(calibrations_folder, sequence, 'calibrations'))
+        errors, opencv_errors, differences = [], [], []
+        elapsed, opencv_elapsed = 0.0, 0.0
+        for camera in cameras.values():
+            K, d = camera.intrinsic(), camera.distortion()
+            width, height = camera.resolution()
+            # known undistorted points and their distorted observations
+            x_undistorted = random.uniform([0, 0], [width, height], size=(n_points, 2))
+            x = distort(x_undistorted, K, d)
+
+            started_at = time.time()
+            for _ in range(repeat):
+                undistorted = camera.undistort(x, iterations=iterations)
+            elapsed += time.time() - started_at
+
+            started_at = time.time()
+            for _ in range(repeat):
+                opencv_undistorted = camera.undistort(x)
+            opencv_elapsed += time.time() - started_at
+
+            errors.append(np.linalg.norm(undistorted - x_undistorted, axis=1))
+            opencv_errors.append(np.linalg.norm(opencv_undistorted - x_undistorted, axis=1))
+            differences.append(np.linalg.norm(undistorted - opencv_undistorted, axis=1))
+
+        errors, opencv_errors = np.concatenate(errors), np.concatenate(opencv_errors)
+        differences = np.concatenate(differences)
+        n_total = repeat * n_points * len(cameras)
+        log.info("{} | {} cameras | vectorized: {:.0f} points/s | OpenCV: {:.0f} points/s",
+                 sequence, len(cameras), n_total / elapsed, n_total / opencv_elapsed)
+        log.info("{} | error (px): vectorized mean {:.2e} max {:.2e} | OpenCV mean {:.2e} "
+                 "max {:.2e} | difference to OpenCV max {:.2e}", sequence, errors.mean(),
+                 errors.max(), opencv_errors.mean(), opencv_errors.max(), differences.max())
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--calibrations-folder',
+        type=str,
+        required=False,
+        default='etc/calibrations',
+        help="""Path to folder containing a folder with the name of each sequence, and
+        inside that a 'calibrations' folder with a JSON calibration file for each camera.""")
+    parser.add_argument(
+        '--n-points',
+        type=int,
+        required=False,
+        default=19 * 20,
+        help="""Number of points undistorted at once on each camera, by default the joints
+        of 20 skeletons.""")
+    parser.add_argument(
+        '--iterations',
+        type=int,
+        required=False,
+        default=5,
+        help="""Number of Newton iterations of the vectorized undistortion.""")
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        required=False,
+        default=100,
+        help="""Number of times the points of each camera are undistorted.""")
+
+    args = parser.parse_args()
+    main(
+        calibrations_folder=args.calibrations_folder,
+        n_points=args.n_points,
+        iterations=args.iterations,
+        repeat=args.repeat)
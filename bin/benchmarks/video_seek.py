@@ -0,0 +1,81 @@
+from argparse import ArgumentParser
+import time
+import cv2
+import numpy as np
+import pandas as pd
+
+from src.utils.video import VideoIterator
+from src.utils.logger import Logger
+
+log = Logger(name='VideoSeekBenchmark')
+
+
+def decode_until(video_file, frame_id):
+    # previous strategy of 'VideoIterator.in_range', decoding every frame before 'frame_id'
+    vc = cv2.VideoCapture(video_file)
+    while int(vc.get(cv2.CAP_PROP_POS_FRAMES)) != frame_id:
+        vc.read()
+    return vc.read()[1]
+
+
+def time_to_first_frame(function, *args):
+    started_at = time.time()
+    frame = function(*args)
+    return frame, 1000.0 * (time.time() - started_at)
+
+
+def main(video_file, offsets, output_file):
+
+    n_frames = VideoIterator(video_file).n_frames()
+    offsets = [offset for offset in offsets if offset < n_frames]
+
+    results = {'offset': [], 'decode_ms': [], 'grab_ms': [], 'seek_ms': [], 'seek_diff': []}
+    for offset in offsets:
+        reference, decode_ms = time_to_first_frame(decode_until, video_file, offset)
+
+        grab_iterator = VideoIterator(video_file, seek_threshold=n_frames)
+        _, grab_ms = time_to_first_frame(grab_iterator.frame_at, offset)
+
+        seek_iterator = VideoIterator(video_file, seek_threshold=0)
+        frame, seek_ms = time_to_first_frame(seek_iterator.frame_at, offset)
+
+        # mean absolute difference against the frame decoded sequentially
+        seek_diff = np.mean(np.abs(frame.astype(np.float32) - reference.astype(np.float32)))
+
+        results['offset'].append(offset)
+        results['decode_ms'].append(decode_ms)
+        results['grab_ms'].append(grab_ms)
+        results['seek_ms'].append(seek_ms)
+        results['seek_diff'].append(seek_diff)
+
+        log.info("offset={} | decode: {:.1f} ms | grab: {:.1f} ms | seek: {:.1f} ms | "
+                 "diff: {:.2f}", offset, decode_ms, grab_ms, seek_ms, seek_diff)
+
+    df = pd.DataFrame(data=results)
+    print(df)
+    if output_file is not None:
+        df.to_csv(output_file, header=True, index=False)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--video',
+        type=str,
+        required=True,
+        help="""Path to a video file from CMU Panoptic dataset, e.g. 'hd_00_00.mp4'.""")
+    parser.add_argument(
+        '--offsets',
+        type=int,
+        nargs='+',
+        default=[0, 100, 500, 1000, 2000, 5000, 10000],
+        help="""Frame ids to measure the time to first frame. Offsets beyond the video
+        length are ignored.""")
+    parser.add_argument(
+        '--output-file',
+        type=str,
+        required=False,
+        help="""CSV file to save the results.""")
+
+    args = parser.parse_args()
+    main(video_file=args.video, offsets=args.offsets, output_file=args.output_file)
@@ -0,0 +1,135 @@
+import json
+from argparse import ArgumentParser
+from os import makedirs, walk
+from os.path import join, dirname, exists, basename
+
+from src.panoptic_dataset.utils import is_video_file, get_camera_id
+from src.utils.encoding import Encoder, EncodingPool, IMAGE_ENCODER_BACKENDS
+from src.utils.encoding import scaled_resolution
+from src.utils.frame_archive import FrameArchiveWriter, archive_file_name
+from src.utils.pipeline import FramePipeline
+from src.utils.video import video_frames
+from src.utils.logger import Logger
+
+log = Logger(name='ExtractFrames')
+
+
+def main(sequence_folder, info_folder, output_folder, cameras, encoder, quality, send_height,
+         encode_workers, decode_segments):
+
+    _, _, video_files = next(walk(sequence_folder))
+    video_files = list(sorted(filter(is_video_file, video_files)))
+    if cameras is not None:
+        video_files = list(filter(lambda x: get_camera_id(x) in cameras, video_files))
+
+    sequence_name = basename(dirname(sequence_folder + '/'))
+    info_file_path = join(info_folder, sequence_name, 'info.json')
+    if not exists(info_file_path):
+        log.critical("'{}' file doesn't exist.", info_file_path)
+    with open(info_file_path) as f:
+        sequence_info = json.load(f)
+    it_range = range(sequence_info['begin'], sequence_info['end'] + 1)
+
+    output_folder_path = join(output_folder, sequence_name, 'frames')
+    if not exists(output_folder_path):
+        makedirs(output_folder_path)
+
+    encoding_pool = EncodingPool(
+        encoder=Encoder(backend=encoder, quality=quality, height=send_height),
+        workers=encode_workers,
+        processes=True)
+
+    for video_file in video_files:
+        camera_id = get_camera_id(video_file)
+        # the archive index is sorted on close, so frames are written as they're decoded
+        frames, resolution = video_frames(
+            join(sequence_folder, video_file), it_range, n_segments=decode_segments,
+            ordered=False)
+
+        metadata = {
+            'sequence': sequence_name,
+            'camera_id': camera_id,
+            'encoder': encoder,
+            'quality': quality,
+            'resolution': resolution,
+            'sent_resolution': scaled_resolution(resolution, send_height),
+        }
+        archive_file_path = join(output_folder_path, archive_file_name(camera_id))
+        writer = FrameArchiveWriter(archive_file_path, metadata=metadata)
+
+        pipeline = FramePipeline(frames=frames, pool=encoding_pool).start()
+        for sample_id, data in pipeline:
+            writer.write(sample_id, data)
+        writer.close()
+
+        stats = pipeline.stats()
+        log.info("[{}][{}] Saved on '{}'. {}", sequence_name, camera_id, archive_file_path,
+                 ', '.join('{}: {:.1f}'.format(key, value) for key, value in stats.items()))
+
+    encoding_pool.shutdown()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--sequence-folder',
+        type=str,
+        required=True,
+        help="""Path to folder containing a sequence from CMU Panoptic dataset.
+        This folder must have MP4 files named with the pattern 'hd_00_{camera_id:02d}.mp4'.""")
+    parser.add_argument(
+        '--info-folder',
+        type=str,
+        required=True,
+        help="""Path to folder, containing a folder inside with the sequence name,
+        and inside that a 'info.json' with begin and end ids of the sequence.""")
+    parser.add_argument(
+        '--output-folder',
+        type=str,
+        required=True,
+        help="""Path to folder to save the archives. A 'frames' folder inside a folder with
+        the sequence name will be created, with an archive for each camera.""")
+    parser.add_argument(
+        '--cameras',
+        type=int,
+        required=False,
+        nargs='+',
+        help="""Cameras to be extracted. If not specified, all videos will be processed.""")
+    parser.add_argument(
+        '--encoder',
+        type=str,
+        default='opencv',
+        choices=IMAGE_ENCODER_BACKENDS,
+        help="""Backend used to encode frames.""")
+    parser.add_argument(
+        '--quality',
+        type=float,
+        default=0.8,
+        help="""Encoding quality, from 0.0 to 1.0.""")
+    parser.add_argument(
+        '--send-height',
+        type=int,
+        required=False,
+        help="""If specified, frames are downscaled to this height before being encoded.""")
+    parser.add_argument(
+        '--encode-workers',
+        type=int,
+        default=4,
+        help="""Number of processes encoding frames.""")
+    parser.add_argument(
+        '--decode-segments',
+        type=int,
+        default=1,
+        help="""Number of processes decoding segments of each video.""")
+
+    args = parser.parse_args()
+    main(
+        sequence_folder=args.sequence_folder,
+        info_folder=args.info_folder,
+        output_folder=args.output_folder,
+        cameras=args.cameras,
+        encoder=args.encoder,
+        quality=args.quality,
+        send_height=args.send_height,
+        encode_workers=args.encode_workers,
+        decode_segments=args.decode_segments)
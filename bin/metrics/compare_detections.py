@@ -0,0 +1,108 @@
+from argparse import ArgumentParser
+from os import walk
+from os.path import join
+from sys import exit
+import pandas as pd
+import numpy as np
+
+from src.utils.logger import Logger
+from src.utils.metrics import match_2d_skeletons
+
+log = Logger(name="CompareDetections")
+
+
+def main(reference_folder, folder, tolerance, output_file):
+
+    _, _, reference_files = next(walk(reference_folder))
+    _, _, files = next(walk(folder))
+    cameras_files = sorted(set(reference_files).intersection(files))
+    if len(cameras_files) == 0:
+        log.critical("There isn't any camera file present on both folders.")
+
+    results = {
+        'camera': [],
+        'samples': [],
+        'matched': [],
+        'missed': [],
+        'mean_px': [],
+        'median_px': [],
+        'p95_px': [],
+        'within_tolerance': [],
+    }
+    for camera_file in cameras_files:
+        reference = pd.read_csv(join(reference_folder, camera_file))
+        detections = pd.read_csv(join(folder, camera_file))
+
+        det_groups = {
+            sample_id: group.values
+            for sample_id, group in detections.groupby('sample_id', sort=False)
+        }
+
+        errors, n_missed = [], 0
+        for sample_id, ref_group in reference.groupby('sample_id', sort=False):
+            if sample_id not in det_groups:
+                n_missed += len(ref_group.index)
+                continue
+            _, matched = match_2d_skeletons(ref_group.values, det_groups[sample_id])
+            n_missed += len(ref_group.index) - len(matched)
+            errors.extend(matched)
+
+        errors = np.hstack(errors) if len(errors) > 0 else np.array([np.nan])
+        errors = errors[~np.isnan(errors)]
+        if errors.size == 0:
+            log.warn("Camera file '{}' doesn't have any joint to compare.", camera_file)
+            continue
+
+        results['camera'].append(camera_file.strip('.csv'))
+        results['samples'].append(reference['sample_id'].nunique())
+        results['matched'].append(len(reference.index) - n_missed)
+        results['missed'].append(n_missed)
+        results['mean_px'].append(np.mean(errors))
+        results['median_px'].append(np.median(errors))
+        results['p95_px'].append(np.percentile(errors, 95))
+        results['within_tolerance'].append(100.0 * np.mean(errors <= tolerance))
+
+    df = pd.DataFrame(data=results)
+    print(df)
+    if output_file is not None:
+        df.to_csv(output_file, header=True, index=False)
+
+    failed = df[df['median_px'] > tolerance]
+    if len(failed.index) > 0:
+        log.error("Median error above {} px on camera(s) {}.", tolerance,
+                  ', '.join(failed['camera']))
+        exit(-1)
+    log.info("Detections match the reference within {} px.", tolerance)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--reference-folder',
+        type=str,
+        required=True,
+        help="""Path to a folder with the CSV file of each camera used as reference, e.g.
+        '2d_annotations/joints19' from a detection with full resolution frames.""")
+    parser.add_argument(
+        '--folder',
+        type=str,
+        required=True,
+        help="""Path to a folder with the CSV file of each camera to be compared with the
+        reference one, e.g. from a detection sending downscaled frames.""")
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=5.0,
+        help="""Maximum median distance, in pixels, between matched joints of each camera.""")
+    parser.add_argument(
+        '--output-file',
+        type=str,
+        required=False,
+        help="""CSV file to save the comparison of each camera.""")
+
+    args = parser.parse_args()
+    main(
+        reference_folder=args.reference_folder,
+        folder=args.folder,
+        tolerance=args.tolerance,
+        output_file=args.output_file)
@@ -1,28 +1,73 @@
 import json
+import time
+from concurrent.futures import ProcessPoolExecutor
 from argparse import ArgumentParser
 import pandas as pd
 import numpy as np
 from os import makedirs, walk
 from os.path import join, dirname, basename, exists
-from itertools import product
 
 from is_msgs.image_pb2 import HumanKeypoints as HKP
-from src.panoptic_dataset.utils import is_sequence_folder
+from src.panoptic_dataset.utils import is_sequence_folder, is_valid_model
 from src.panoptic_dataset.joints import index_to_human_keypoint
 from src.utils.logger import Logger
-from src.utils.metrics import error_per_joint, possible_groups
+from src.utils.metrics import errors_per_joint, mean_error, optimal_group, split_by_sample
 
 log = Logger(name="MetricsFromDetections")
 
 
-def main(dataset_folder, experiment_folders, output_folder, output_prefix):
+# ground truth of each (sequence, pose model) with its sample ids, shared by the workers
+_ground_truth = None
+
+
+def _init_worker(ground_truth):
+    global _ground_truth
+    _ground_truth = ground_truth
+
+
+def evaluate(unit):
+    """
+    Evaluates an (experiment name, sequence, pose model, experiment data file) unit. Returns
+    the percentage of individuals localized, the mean error of each joint, and the number of
+    samples of each joint mean.
+    """
+    exp_name, exp_seq_folder, pose_model_folder, exp_data_file_path = unit
+    gt_data, range_sample_id = _ground_truth[(exp_seq_folder, pose_model_folder)]
+    exp_data = pd.read_csv(exp_data_file_path)
+
+    started_at = time.time()
+    errors = []
+    samples = zip(
+        split_by_sample(gt_data, range_sample_id), split_by_sample(exp_data, range_sample_id))
+    for _gt_data, _exp_data in samples:
+        sample_errors = errors_per_joint(_gt_data, _exp_data)
+        best_group = optimal_group(
+            range(_gt_data.shape[0]), range(_exp_data.shape[0]), mean_error(sample_errors))
+        if len(best_group) == 0:
+            continue
+
+        errors.append(np.vstack([sample_errors[pair] for pair in best_group]))
+    log.info("[{}] {} {} | {} samples evaluated in {:.2f}s", exp_name, exp_seq_folder,
+             pose_model_folder, len(range_sample_id), time.time() - started_at)
+
+    errors = np.vstack(errors)
+
+    gt_number_individuals = len(gt_data.index)
+    exp_number_individuals = errors.shape[0]
+    ratio_number_individuals = exp_number_individuals / gt_number_individuals
+
+    errors_n_samples = np.sum(~np.isnan(errors), axis=0)
+    errors = np.nanmean(errors, axis=0)
+    return 100.0 * ratio_number_individuals, errors, errors_n_samples
+
+
+def main(dataset_folder, experiment_folders, output_folder, output_prefix, workers):
 
     np.set_printoptions(precision=2)
     pd.set_option('precision', 2)
 
-    errors_global, errors_n_samples_global = [], []
-    output_data = {'experiment': [], 'sequence': [], 'g_ind': []}
-
+    # ground truth is read once per sequence and pose model, whatever the experiments
+    units, ground_truth = [], {}
     for experiment_folder in experiment_folders:
         exp_name = basename(dirname(experiment_folder + '/'))
         _, exp_seq_folders, _ = next(walk(experiment_folder))
@@ -38,53 +83,34 @@ def main(dataset_folder, experiment_folders, output_folder, output_prefix):
             range_sample_id = range(info_data['begin'], info_data['end'] + 1)
 
             gt_data_folder_path = join(dataset_folder, exp_seq_folder, '3d_annotations')
-            errors = []
             for pose_model_folder in pose_model_folders:
-                exp_data_folder_path = join(exp_seq_folder_path, pose_model_folder)
-                exp_data_file_path = join(exp_data_folder_path, 'data.csv')
-                exp_data = pd.read_csv(exp_data_file_path)
-
-                gt_data_file_path = join(gt_data_folder_path, pose_model_folder, 'data.csv')
-                gt_data = pd.read_csv(gt_data_file_path)
-
-                for sample_id in range_sample_id:
-                    _gt_data = gt_data[gt_data['sample_id'] == sample_id]
-                    _exp_data = exp_data[exp_data['sample_id'] == sample_id]
-
-                    _gt_its, _exp_its = _gt_data.index, _exp_data.index
-                    error_pairs = {
-                        pair: error_per_joint(
-                            gt_data.iloc[pair[0]],
-                            exp_data.iloc[pair[1]],
-                            pose_model=pose_model_folder)
-                        for pair in product(_gt_its, _exp_its)
-                    }
-
-                    def group_error(group):
-                        return sum(map(lambda x: np.nanmean(error_pairs[x]), group))
-
-                    best_group = min(possible_groups(_gt_its, _exp_its), key=group_error)
-                    if len(best_group) == 0:
-                        continue
-
-                    sample_errors = np.vstack(map(lambda x: error_pairs[x], best_group))
-                    errors.append(sample_errors)
+                is_valid_model(pose_model_folder)
+                exp_data_file_path = join(exp_seq_folder_path, pose_model_folder, 'data.csv')
+                units.append((exp_name, exp_seq_folder, pose_model_folder, exp_data_file_path))
+
+                if (exp_seq_folder, pose_model_folder) not in ground_truth:
+                    gt_data_file_path = join(gt_data_folder_path, pose_model_folder, 'data.csv')
+                    ground_truth[(exp_seq_folder, pose_model_folder)] = (
+                        pd.read_csv(gt_data_file_path), range_sample_id)
+
+    if workers > 1:
+        with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker,
+                initargs=(ground_truth, )) as executor:
+            results = list(executor.map(evaluate, units))
+    else:
+        _init_worker(ground_truth)
+        results = list(map(evaluate, units))
 
-                errors = np.vstack(errors)
-
-                gt_number_individuals = len(gt_data.index)
-                exp_number_individuals = errors.shape[0]
-
-                ratio_number_individuals = exp_number_individuals / gt_number_individuals
-                output_data['experiment'].append(exp_name)
-                output_data['sequence'].append(exp_seq_folder)
-                output_data['g_ind'].append(100.0 * ratio_number_individuals)
-
-                errors_n_samples = np.sum(~np.isnan(errors), axis=0)
-                errors = np.nanmean(errors, axis=0)
+    errors_global, errors_n_samples_global = [], []
+    output_data = {'experiment': [], 'sequence': [], 'g_ind': []}
+    for (exp_name, exp_seq_folder, _, _), (g_ind, errors, errors_n_samples) in zip(units, results):
+        output_data['experiment'].append(exp_name)
+        output_data['sequence'].append(exp_seq_folder)
+        output_data['g_ind'].append(g_ind)
 
-                errors_global.append(errors)
-                errors_n_samples_global.append(errors_n_samples)
+        errors_global.append(errors)
+        errors_n_samples_global.append(errors_n_samples)
 
     errors_global = np.vstack(errors_global)
     errors_n_samples_global = np.vstack(errors_n_samples_global)
@@ -132,10 +158,17 @@ if __name__ == '__main__':
         type=str,
         default="",
         help="""Prefix string to be added on output files.""")
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help="""Number of processes evaluating (experiment, sequence, pose model) units in
+        parallel. Ground truth is read once and shared by all of them.""")
 
     args = parser.parse_args()
     main(
         dataset_folder=args.dataset_folder,
         experiment_folders=args.experiment_folders,
         output_prefix=args.output_prefix,
-        output_folder=args.output_folder)
\ No newline at end of file
+        output_folder=args.output_folder,
+        workers=args.workers)
\ No newline at end of file
@@ -1,4 +1,6 @@
 import json
+import time
+from concurrent.futures import ProcessPoolExecutor
 from argparse import ArgumentParser
 import pandas as pd
 import numpy as np
@@ -7,23 +9,66 @@ from os.path import join, dirname, basename, exists
 from shutil import rmtree
 
 from is_msgs.image_pb2 import HumanKeypoints as HKP
-from src.panoptic_dataset.utils import is_sequence_folder
+from src.panoptic_dataset.utils import is_sequence_folder, is_valid_model
 from src.panoptic_dataset.joints import index_to_human_keypoint
 from src.utils.logger import Logger
-from src.utils.metrics import error_per_joint
+from src.utils.metrics import errors_per_joint, split_by_sample
 
 log = Logger(name="MetricsFromGroundTruth")
 
 
-def main(dataset_folder, experiment_folders, output_folder):
+# ground truth of each (sequence, pose model) with its sample ids, shared by the workers
+_ground_truth = None
+
+
+def _init_worker(ground_truth):
+    global _ground_truth
+    _ground_truth = ground_truth
+
+
+def evaluate(unit):
+    """
+    Evaluates an (experiment name, sequence, pose model, experiment data file) unit. Returns
+    the percentage of individuals localized, the mean error of each joint, and the number of
+    samples of each joint mean.
+    """
+    exp_name, exp_seq_folder, pose_model_folder, exp_data_file_path = unit
+    gt_data, range_sample_id = _ground_truth[(exp_seq_folder, pose_model_folder)]
+    exp_data = pd.read_csv(exp_data_file_path)
+    exp_data = exp_data[exp_data['person_id'] >= 0]
+
+    gt_number_individuals = len(gt_data.index)
+    exp_number_individuals = len(exp_data.index)
+    ratio_number_individuals = exp_number_individuals / gt_number_individuals
+
+    started_at = time.time()
+    errors = []
+    samples = zip(
+        split_by_sample(gt_data, range_sample_id), split_by_sample(exp_data, range_sample_id))
+    for _gt_data, _exp_data in samples:
+        # each skeleton is compared with the first ground truth of its person
+        first_rows = {}
+        for row, person_id in enumerate(_gt_data[:, 1]):
+            first_rows.setdefault(person_id, row)
+        gt_rows = [first_rows[person_id] for person_id in _exp_data[:, 1]]
+        exp_rows = np.arange(_exp_data.shape[0])
+        errors.append(errors_per_joint(_gt_data, _exp_data)[gt_rows, exp_rows])
+    log.info("[{}] {} {} | {} samples evaluated in {:.2f}s", exp_name, exp_seq_folder,
+             pose_model_folder, len(range_sample_id), time.time() - started_at)
+
+    errors = np.vstack(errors)
+    errors_n_samples = np.sum(~np.isnan(errors), axis=0)
+    errors = np.nanmean(errors, axis=0)
+    return 100.0 * ratio_number_individuals, errors, errors_n_samples
+
+
+def main(dataset_folder, experiment_folders, output_folder, workers):
 
     np.set_printoptions(precision=2)
     pd.set_option('precision', 2)
 
-    gt_number_individuals_global, exp_number_individuals_global = 0, 0
-    errors_global, errors_n_samples_global = [], []
-    output_data = {'experiment': [], 'sequence': [], 'g_ind': []}
-
+    # ground truth is read once per sequence and pose model, whatever the experiments
+    units, ground_truth = [], {}
     for experiment_folder in experiment_folders:
         exp_name = basename(dirname(experiment_folder + '/'))
         _, exp_seq_folders, _ = next(walk(experiment_folder))
@@ -39,41 +84,34 @@ def main(dataset_folder, experiment_folders, output_folder):
             range_sample_id = range(info_data['begin'], info_data['end'] + 1)
 
             gt_data_folder_path = join(dataset_folder, exp_seq_folder, '3d_annotations')
-            errors = []
             for pose_model_folder in pose_model_folders:
-                exp_data_folder_path = join(exp_seq_folder_path, pose_model_folder)
-                exp_data_file_path = join(exp_data_folder_path, 'data.csv')
-                exp_data = pd.read_csv(exp_data_file_path)
-                exp_data = exp_data[exp_data['person_id'] >= 0]
-
-                gt_data_file_path = join(gt_data_folder_path, pose_model_folder, 'data.csv')
-                gt_data = pd.read_csv(gt_data_file_path)
-
-                gt_number_individuals = len(gt_data.index)
-                exp_number_individuals = len(exp_data.index)
-
-                gt_number_individuals_global += gt_number_individuals
-                exp_number_individuals_global += exp_number_individuals
+                is_valid_model(pose_model_folder)
+                exp_data_file_path = join(exp_seq_folder_path, pose_model_folder, 'data.csv')
+                units.append((exp_name, exp_seq_folder, pose_model_folder, exp_data_file_path))
+
+                if (exp_seq_folder, pose_model_folder) not in ground_truth:
+                    gt_data_file_path = join(gt_data_folder_path, pose_model_folder, 'data.csv')
+                    ground_truth[(exp_seq_folder, pose_model_folder)] = (
+                        pd.read_csv(gt_data_file_path), range_sample_id)
+
+    if workers > 1:
+        with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker,
+                initargs=(ground_truth, )) as executor:
+            results = list(executor.map(evaluate, units))
+    else:
+        _init_worker(ground_truth)
+        results = list(map(evaluate, units))
 
-                ratio_number_individuals = exp_number_individuals / gt_number_individuals
-                output_data['experiment'].append(exp_name)
-                output_data['sequence'].append(exp_seq_folder)
-                output_data['g_ind'].append(100.0 * ratio_number_individuals)
-
-                for sample_id in range_sample_id:
-                    _gt_data = gt_data[gt_data['sample_id'] == sample_id]
-                    _exp_data = exp_data[exp_data['sample_id'] == sample_id]
-                    for _, exp_ind in _exp_data.iterrows():
-                        gt_ind = _gt_data[_gt_data['person_id'] == exp_ind['person_id']].iloc[0]
-                        error = error_per_joint(gt_ind, exp_ind, pose_model=pose_model_folder)
-                        errors.append(error)
-
-                errors = np.vstack(errors)
-                errors_n_samples = np.sum(~np.isnan(errors), axis=0)
-                errors = np.nanmean(errors, axis=0)
+    errors_global, errors_n_samples_global = [], []
+    output_data = {'experiment': [], 'sequence': [], 'g_ind': []}
+    for (exp_name, exp_seq_folder, _, _), (g_ind, errors, errors_n_samples) in zip(units, results):
+        output_data['experiment'].append(exp_name)
+        output_data['sequence'].append(exp_seq_folder)
+        output_data['g_ind'].append(g_ind)
 
-                errors_global.append(errors)
-                errors_n_samples_global.append(errors_n_samples)
+        errors_global.append(errors)
+        errors_n_samples_global.append(errors_n_samples)
 
     errors_global = np.vstack(errors_global)
     errors_n_samples_global = np.vstack(errors_n_samples_global)
@@ -116,9 +154,16 @@ if __name__ == '__main__':
         type=str,
         required=True,
         help="""Path to folder to save CSV files with results.""")
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help="""Number of processes evaluating (experiment, sequence, pose model) units in
+        parallel. Ground truth is read once and shared by all of them.""")
 
     args = parser.parse_args()
     main(
         dataset_folder=args.dataset_folder,
         experiment_folders=args.experiment_folders,
-        output_folder=args.output_folder)
\ No newline at end of file
+        output_folder=args.output_folder,
+        workers=args.workers)
\ No newline at end of file
@@ -0,0 +1,327 @@
+import json
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from os import makedirs, walk, cpu_count
+from os.path import join, dirname, exists, basename
+from shutil import rmtree
+import numpy as np
+
+from src.utils.arparse import ArgumentParserFile
+from src.utils.logger import Logger
+from src.utils.sinks import CsvSink
+from src.reconstruction.cameras import load_cameras
+from src.reconstruction.grouper import SkeletonsGrouper
+from src.reconstruction.association import affinity_matrices, ASSOCIATION_METHODS
+from src.panoptic_dataset.utils import is_valid_model, make_df_columns, read_detections
+
+log = Logger(name='CameraSweep')
+
+EXPERIMENT_PATTERN = re.compile(r'^exp[0-9]+$')
+
+# grouper and precomputed samples of each worker process, created once per sequence
+_grouper = None
+_samples = None
+
+
+def _init_worker(cameras, options, samples):
+    global _grouper, _samples
+    _grouper = SkeletonsGrouper(cameras, **options)
+    _samples = samples
+
+
+def _localize_subset(subset, sample_ids):
+    """
+    Localizes 'sample_ids' seeing only the cameras of 'subset', reusing the undistorted
+    points and the affinity matrices computed for all cameras.
+    """
+    results = []
+    for sample_id in sample_ids:
+        detections, points, valid, affinities = _samples[sample_id]
+        cameras = [camera_id for camera_id in subset if camera_id in points]
+        _, skeletons = _grouper.localize(
+            {camera_id: detections[camera_id] for camera_id in cameras},
+            {camera_id: points[camera_id] for camera_id in cameras},
+            {camera_id: valid[camera_id] for camera_id in cameras},
+            {pair: affinity for pair, affinity in affinities.items()
+             if pair[0] in subset and pair[1] in subset})
+        results.append((sample_id, skeletons))
+    return results
+
+
+def precompute(grouper, detections):
+    """
+    Undistorted points of all detections, one call per camera, and the affinity matrices
+    of every camera pair, for each sample. Returns a dictionary mapping sample ids to
+    (detections, points, valid, affinities) tuples.
+    """
+    points, valid = {}, {}
+    for camera_id in grouper.cameras().keys():
+        sample_ids = [
+            sample_id for sample_id, sample in detections.items()
+            if camera_id in sample and sample[camera_id].shape[0] > 0
+        ]
+        if len(sample_ids) == 0:
+            continue
+        skeletons = [detections[sample_id][camera_id] for sample_id in sample_ids]
+        all_points, all_valid = grouper.undistort({camera_id: np.concatenate(skeletons)})
+        splits = np.cumsum([s.shape[0] for s in skeletons])[:-1]
+        for sample_id, sample_points, sample_valid in zip(
+                sample_ids, np.split(all_points[camera_id], splits),
+                np.split(all_valid[camera_id], splits)):
+            points.setdefault(sample_id, {})[camera_id] = sample_points
+            valid.setdefault(sample_id, {})[camera_id] = sample_valid
+
+    samples = {}
+    for sample_id, sample in detections.items():
+        sample_points, sample_valid = points.get(sample_id, {}), valid.get(sample_id, {})
+        affinities = affinity_matrices(sample_points, sample_valid, grouper.fundamentals())
+        samples[sample_id] = (sample, sample_points, sample_valid, affinities)
+    return samples
+
+
+def read_subsets(subsets, experiments_folder, cameras, subset_size):
+    """
+    Camera subsets to evaluate, as a dictionary mapping names to sorted tuples of cameras.
+    Subsets are given as comma separated cameras, read from the 'request_options.json' of
+    the experiments on 'experiments_folder', or all combinations of 'subset_size' cameras.
+    """
+    named_subsets = {}
+    for subset in subsets or []:
+        cameras_subset = tuple(sorted(int(camera) for camera in subset.split(',')))
+        named_subsets['cameras_' + '_'.join(map(str, cameras_subset))] = cameras_subset
+
+    if experiments_folder is not None:
+        _, experiment_folders, _ = next(walk(experiments_folder))
+        for experiment in sorted(filter(EXPERIMENT_PATTERN.match, experiment_folders)):
+            options_file_path = join(experiments_folder, experiment, 'request_options.json')
+            if not exists(options_file_path):
+                continue
+            with open(options_file_path, 'r') as f:
+                options = json.load(f)
+            if 'cameras' in options:
+                named_subsets[experiment] = tuple(sorted(options['cameras']))
+
+    if cameras is not None and subset_size is not None:
+        for cameras_subset in combinations(sorted(cameras), subset_size):
+            named_subsets['cameras_' + '_'.join(map(str, cameras_subset))] = cameras_subset
+    return named_subsets
+
+
+def main(sequence_folders, calibrations_folder, output_folder, pose_model, subsets,
+         experiments_folder, cameras, subset_size, min_error, max_distance, min_score,
+         association, workers, chunk_size):
+
+    try:
+        is_valid_model(pose_model)
+    except Exception as ex:
+        log.critical(str(ex))
+
+    named_subsets = read_subsets(subsets, experiments_folder, cameras, subset_size)
+    if len(named_subsets) == 0:
+        log.critical("No camera subsets. Use '--subsets', '--experiments-folder' or "
+                     "'--cameras' with '--subset-size'.")
+
+    # experiments with the same cameras are localized only once
+    unique_subsets = {}
+    for name, cameras_subset in sorted(named_subsets.items()):
+        unique_subsets.setdefault(cameras_subset, []).append(name)
+    all_cameras = sorted(set(camera for subset in unique_subsets for camera in subset))
+    log.info("{} subsets, {} unique, over cameras {}", len(named_subsets), len(unique_subsets),
+             all_cameras)
+
+    columns = make_df_columns(pose_model)
+    options = {
+        'min_error': min_error,
+        'max_distance': max_distance,
+        'min_score': min_score,
+        'association': association,
+    }
+
+    for sequence_folder in sequence_folders:
+        info_file_path = join(sequence_folder, 'info.json')
+        if not exists(info_file_path):
+            log.critical("'{}' file doesn't exist.", info_file_path)
+        with open(info_file_path, 'r') as f:
+            sequence_info = json.load(f)
+
+        sequence_name = basename(dirname(sequence_folder + '/'))
+        annotations_folder_path = join(sequence_folder, '2d_annotations', pose_model)
+        _, _, annotations_files_available = next(walk(annotations_folder_path))
+        available_cameras = list(map(lambda x: int(x.strip('.csv')), annotations_files_available))
+        not_available_cameras = set(all_cameras).difference(available_cameras)
+        if len(not_available_cameras) > 0:
+            nav_cam_str = ', '.join(map(str, sorted(not_available_cameras)))
+            log.critical("For sequence {}, model {}, camera(s) {} are not available. Exiting.",
+                         sequence_folder, pose_model, nav_cam_str)
+
+        try:
+            calibrations = load_cameras(
+                join(calibrations_folder, sequence_name, 'calibrations'), all_cameras)
+        except Exception as ex:
+            log.critical(str(ex))
+
+        started_at = time.time()
+        detections = read_detections(annotations_folder_path, all_cameras)
+        sample_ids = list(range(sequence_info['begin'], sequence_info['end'] + 1))
+        samples = precompute(
+            SkeletonsGrouper(calibrations, **options),
+            {sample_id: detections.get(sample_id, {}) for sample_id in sample_ids})
+        log.info("[{}] {} samples of {} cameras read and precomputed in {:.1f}s", sequence_name,
+                 len(samples), len(all_cameras), time.time() - started_at)
+
+        sinks = {}
+        for names in unique_subsets.values():
+            for name in names:
+                output_folder_path = join(output_folder, name, sequence_name, pose_model)
+                if exists(output_folder_path):
+                    rmtree(output_folder_path)
+                makedirs(output_folder_path)
+                sinks[name] = CsvSink(
+                    join(output_folder_path, 'data.csv'),
+                    columns=columns,
+                    first_sample_id=sample_ids[0])
+
+        started_at = time.time()
+        chunks = [sample_ids[i:i + chunk_size] for i in range(0, len(sample_ids), chunk_size)]
+        with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker,
+                initargs=(calibrations, options, samples)) as executor:
+            futures = [(names, executor.submit(_localize_subset, subset, chunk))
+                       for subset, names in unique_subsets.items() for chunk in chunks]
+            for names, future in futures:
+                for sample_id, skeletons in future.result():
+                    n_skeletons = len(skeletons)
+                    if n_skeletons == 0:
+                        localizations_array = np.zeros((0, len(columns)))
+                    else:
+                        localizations_array = np.hstack([
+                            np.full((n_skeletons, 1), sample_id),
+                            np.arange(n_skeletons).reshape(-1, 1),
+                            np.stack(skeletons).reshape(n_skeletons, -1),
+                        ])
+                    for name in names:
+                        sinks[name].write(sample_id, localizations_array)
+        for sink in sinks.values():
+            sink.close()
+
+        elapsed = time.time() - started_at
+        n_localized = len(unique_subsets) * len(sample_ids)
+        log.info("[{}] {} subsets localized in {:.1f}s, {:.1f} samples/s. Results saved on {}",
+                 sequence_name, len(unique_subsets), elapsed, n_localized / elapsed,
+                 output_folder)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParserFile(parse_from_file=True)
+    parser.add_argument(
+        '--sequence-folders',
+        type=str,
+        required=True,
+        nargs='+',
+        help="""Paths to folders containing a sequence from CMU Panoptic dataset, each one
+        with an 'info.json' file and a '2d_annotations' folder containing a folder named
+        with the pose model, i.e., 'joints15' or 'joints19'.""")
+    parser.add_argument(
+        '--calibrations-folder',
+        type=str,
+        required=False,
+        default='etc/calibrations',
+        help="""Path to folder containing a folder with the name of each sequence, and
+        inside that a 'calibrations' folder with a JSON calibration file for each camera.""")
+    parser.add_argument(
+        '--output-folder',
+        type=str,
+        required=True,
+        help="""Path to folder where a folder for each subset is created. Localizations are
+        saved on '{subset}/{sequence}/{pose_model}/data.csv', the layout expected by the
+        metrics scripts.""")
+    parser.add_argument(
+        '--pose-model',
+        type=str,
+        required=False,
+        default='joints19',
+        help="""Pose model of the 2D detections, can be either 'joints15' or 'joints19'.""")
+    parser.add_argument(
+        '--subsets',
+        type=str,
+        required=False,
+        nargs='+',
+        help="""Camera subsets, each one as comma separated cameras, e.g. '0,3,7,10,23'.""")
+    parser.add_argument(
+        '--experiments-folder',
+        type=str,
+        required=False,
+        help="""Folder with 'exp*' folders, e.g. 'etc/experiments/request_skeleton_localization',
+        whose 'request_options.json' cameras are evaluated, named by experiment.""")
+    parser.add_argument(
+        '--cameras',
+        type=int,
+        required=False,
+        nargs='+',
+        help="""Cameras to evaluate all combinations of '--subset-size' cameras.""")
+    parser.add_argument(
+        '--subset-size',
+        type=int,
+        required=False,
+        help="""Number of cameras on each combination of '--cameras'.""")
+    parser.add_argument(
+        '--min-error',
+        type=float,
+        required=False,
+        default=50.0,
+        help="""Skeletons are associated if their mean epipolar distance, in pixels, is below
+        this. Same as the grouper 'min_error' option.""")
+    parser.add_argument(
+        '--max-distance',
+        type=float,
+        required=False,
+        default=75.0,
+        help="""3D skeletons closer than this distance are merged. Same as the grouper
+        'max_distance' option.""")
+    parser.add_argument(
+        '--min-score',
+        type=float,
+        required=False,
+        default=0.0,
+        help="""Joints with score not greater than this are ignored. Same as the grouper
+        'min_score' option.""")
+    parser.add_argument(
+        '--association',
+        type=str,
+        required=False,
+        default='greedy',
+        choices=ASSOCIATION_METHODS,
+        help="""How skeletons are associated across cameras, either 'greedy' or 'hungarian'.
+        Same as on 'bin.reconstruction.skeleton_localization'.""")
+    parser.add_argument(
+        '--workers',
+        type=int,
+        required=False,
+        default=cpu_count(),
+        help="""Number of processes localizing subsets.""")
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        required=False,
+        default=100,
+        help="""Number of samples of a subset sent at once to each process.""")
+
+    args = parser.parse_args()
+
+    main(
+        sequence_folders=args.sequence_folders,
+        calibrations_folder=args.calibrations_folder,
+        output_folder=args.output_folder,
+        pose_model=args.pose_model,
+        subsets=args.subsets,
+        experiments_folder=args.experiments_folder,
+        cameras=args.cameras,
+        subset_size=args.subset_size,
+        min_error=args.min_error,
+        max_distance=args.max_distance,
+        min_score=args.min_score,
+        association=args.association,
+        workers=args.workers,
+        chunk_size=args.chunk_size)
@@ -0,0 +1,266 @@
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from os import makedirs, walk, cpu_count
+from os.path import join, dirname, exists, basename
+from shutil import rmtree
+import numpy as np
+
+from src.utils.arparse import ArgumentParserFile
+from src.utils.logger import Logger
+from src.utils.sinks import CsvSink
+from src.reconstruction.cameras import load_cameras
+from src.reconstruction.grouper import SkeletonsGrouper
+from src.reconstruction.tracking import SkeletonsTracker
+from src.reconstruction.association import ASSOCIATION_METHODS
+from src.panoptic_dataset.utils import is_valid_model, make_df_columns, read_detections
+
+log = Logger(name='LocalSkeletonLocalization')
+
+# grouper of each worker process, created once with the calibrations
+_grouper = None
+_tracking_options = None
+
+
+def _init_worker(cameras, options, tracking_options):
+    global _grouper, _tracking_options
+    _grouper = SkeletonsGrouper(cameras, **options)
+    _tracking_options = tracking_options
+
+
+def _group_samples(samples):
+    """
+    Localizes a chunk of consecutive samples. Returns, for each sample, its id, the 3D
+    skeletons and their person ids, which are only kept along the chunk when tracking.
+    Also returns the number of person ids used and the tracker statistics, if any.
+    """
+    if _tracking_options is None:
+        results = []
+        for sample_id, detections in samples:
+            skeletons = _grouper.group(detections)
+            results.append((sample_id, skeletons, np.arange(skeletons.shape[0])))
+        return results, 0, None
+
+    tracker = SkeletonsTracker(_grouper, **_tracking_options)
+    results = [(sample_id, ) + tracker.track(detections) for sample_id, detections in samples]
+    return results, tracker.n_tracks(), tracker.stats()
+
+
+def main(sequence_folder, info_folder, calibrations_folder, output_folder, pose_model, cameras,
+         min_error, max_distance, min_score, association, tracking, max_missed, workers,
+         chunk_size):
+
+    info_file_path = join(info_folder if info_folder is not None else sequence_folder, 'info.json')
+    if not exists(info_file_path):
+        log.critical("'{}' file doesn't exist.", info_file_path)
+
+    with open(info_file_path, 'r') as f:
+        sequence_info = json.load(f)
+
+    try:
+        is_valid_model(pose_model)
+    except Exception as ex:
+        log.critical(str(ex))
+
+    sequence_name = basename(dirname(sequence_folder + '/'))
+    annotations_folder_path = join(sequence_folder, '2d_annotations', pose_model)
+    _, _, annotations_files_available = next(walk(annotations_folder_path))
+
+    available_cameras = list(map(lambda x: int(x.strip('.csv')), annotations_files_available))
+    not_available_cameras = set(cameras).difference(available_cameras)
+    if len(not_available_cameras) > 0:
+        nav_cam_str = ', '.join(map(str, sorted(not_available_cameras)))
+        log.critical("For sequence {}, model {}, camera(s) {} are not available. Exiting.",
+                     sequence_folder, pose_model, nav_cam_str)
+
+    try:
+        calibrations = load_cameras(
+            join(calibrations_folder, sequence_name, 'calibrations'), cameras)
+    except Exception as ex:
+        log.critical(str(ex))
+
+    output_folder_path = join(output_folder, sequence_name, pose_model)
+    if exists(output_folder_path):
+        rmtree(output_folder_path)
+    makedirs(output_folder_path)
+    output_file_path = join(output_folder_path, 'data.csv')
+
+    started_at = time.time()
+    detections = read_detections(annotations_folder_path, cameras)
+    sample_ids = list(range(sequence_info['begin'], sequence_info['end'] + 1))
+    samples = [(sample_id, detections.get(sample_id, {})) for sample_id in sample_ids]
+    chunks = [samples[i:i + chunk_size] for i in range(0, len(samples), chunk_size)]
+    log.info("[{}] {} samples read in {:.1f}s", sequence_name, len(samples),
+             time.time() - started_at)
+
+    columns = make_df_columns(pose_model)
+    sink = CsvSink(output_file_path, columns=columns, first_sample_id=sample_ids[0])
+    options = {
+        'min_error': min_error,
+        'max_distance': max_distance,
+        'min_score': min_score,
+        'association': association,
+    }
+
+    tracking_options = None
+    if tracking:
+        tracking_options = {
+            'max_error': min_error,
+            'max_distance': max_distance,
+            'max_missed': max_missed,
+        }
+
+    started_at = time.time()
+    # chunks are tracked independently, so their person ids are offset to not collide
+    ids_offset = 0
+    tracked, associated = 0, 0
+    with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(calibrations, options, tracking_options)) as executor:
+        futures = [executor.submit(_group_samples, chunk) for chunk in chunks]
+        for future in futures:
+            results, n_ids, stats = future.result()
+            for sample_id, skeletons, person_ids in results:
+                n_skeletons = skeletons.shape[0]
+                if n_skeletons == 0:
+                    sink.write(sample_id, np.zeros((0, len(columns))))
+                    continue
+                localizations_array = np.hstack([
+                    np.full((n_skeletons, 1), sample_id),
+                    (ids_offset + person_ids).reshape(-1, 1),
+                    skeletons.reshape(n_skeletons, -1),
+                ])
+                sink.write(sample_id, localizations_array)
+            ids_offset += n_ids
+            if stats is not None:
+                tracked += stats['tracked_detections']
+                associated += stats['associated_detections']
+    sink.close()
+
+    if tracking:
+        log.info("[{}] {} person ids, {:.1f}% of detections assigned by tracking",
+                 sequence_name, ids_offset,
+                 100.0 * tracked / max(tracked + associated, 1))
+
+    elapsed = time.time() - started_at
+    log.info("[{}] {} samples localized in {:.1f}s, {:.1f} samples/s. Results saved on {}",
+             sequence_name, len(samples), elapsed, len(samples) / elapsed, output_file_path)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParserFile(parse_from_file=True)
+    parser.add_argument(
+        '--sequence-folder',
+        type=str,
+        required=True,
+        help="""Path to folder containing a sequence from CMU Panoptic dataset.
+        This folder must have a '2d_annotations' folder containing a folder
+        named with the pose model, i.e., 'joints15' or 'joints19'.""")
+    parser.add_argument(
+        '--info-folder',
+        type=str,
+        required=False,
+        help="""Path to folder, containing a folder inside with the sequence name,
+        and inside that a 'info.json' with begin and end ids of the sequence.
+        If no specified, will be look for inside sequence folder.""")
+    parser.add_argument(
+        '--calibrations-folder',
+        type=str,
+        required=False,
+        default='etc/calibrations',
+        help="""Path to folder containing a folder with the name of each sequence, and
+        inside that a 'calibrations' folder with a JSON calibration file for each camera.""")
+    parser.add_argument(
+        '--output-folder',
+        type=str,
+        required=True,
+        help="""Path to folder to save a data.csv file with results.
+        A folder with the sequence name and another inside that with the
+        pose model will be created to save this file.""")
+    parser.add_argument(
+        '--pose-model',
+        type=str,
+        required=False,
+        default='joints19',
+        help="""You can specify what model to process, can be either 'joints15'
+        or 'joints19'.""")
+    parser.add_argument(
+        '--cameras',
+        type=int,
+        required=True,
+        nargs='+',
+        help="""Cameras need to be specified with their ids. If a specified
+        camera doesn't have the 2D annotations file related to itself, the
+        program will terminate.""")
+    parser.add_argument(
+        '--min-error',
+        type=float,
+        required=False,
+        default=50.0,
+        help="""Maximum mean epipolar distance, in pixels, between joints of skeletons
+        detected on two cameras to be associated. Same as the grouper 'min_error' option.""")
+    parser.add_argument(
+        '--max-distance',
+        type=float,
+        required=False,
+        default=75.0,
+        help="""3D skeletons closer than this distance are merged. Same as the grouper
+        'max_distance' option.""")
+    parser.add_argument(
+        '--min-score',
+        type=float,
+        required=False,
+        default=0.0,
+        help="""Joints with score not greater than this are ignored. Same as the grouper
+        'min_score' option.""")
+    parser.add_argument(
+        '--association',
+        type=str,
+        required=False,
+        default='greedy',
+        choices=ASSOCIATION_METHODS,
+        help="""How skeletons are associated across cameras. 'greedy' groups them from the
+        lowest epipolar error pair, like the grouper service. 'hungarian' matches each camera
+        pair optimally and keeps groups consistent across all their cameras.""")
+    parser.add_argument(
+        '--tracking',
+        action='store_true',
+        help="""Track skeletons along consecutive samples, keeping their person ids. Tracked
+        skeletons are projected on each camera to assign the new detections, and only
+        unassigned ones are associated. Each chunk of samples is tracked independently.""")
+    parser.add_argument(
+        '--max-missed',
+        type=int,
+        required=False,
+        default=5,
+        help="""Number of samples a tracked skeleton can be missing before being dropped.""")
+    parser.add_argument(
+        '--workers',
+        type=int,
+        required=False,
+        default=cpu_count(),
+        help="""Number of processes localizing samples.""")
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        required=False,
+        default=100,
+        help="""Number of samples sent at once to each process.""")
+
+    args = parser.parse_args()
+
+    main(
+        sequence_folder=args.sequence_folder,
+        info_folder=args.info_folder,
+        calibrations_folder=args.calibrations_folder,
+        output_folder=args.output_folder,
+        pose_model=args.pose_model,
+        cameras=args.cameras,
+        min_error=args.min_error,
+        max_distance=args.max_distance,
+        min_score=args.min_score,
+        association=args.association,
+        tracking=args.tracking,
+        max_missed=args.max_missed,
+        workers=args.workers,
+        chunk_size=args.chunk_size)
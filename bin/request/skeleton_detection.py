@@ -1,28 +1,40 @@
 import json
+from collections import defaultdict, deque
 from sys import exit
 from os import makedirs, walk
 from os.path import join, dirname, exists, basename
 from shutil import rmtree
 from urllib.parse import urlparse
-import numpy as np
-import pandas as pd
 
 from is_wire.core import Channel, Logger
 from is_wire.core import ZipkinExporter, BackgroundThreadTransport
-from is_msgs.image_pb2 import ObjectAnnotations
+from is_msgs.image_pb2 import Image, ObjectAnnotations
 from src.utils.arparse import ArgumentParserFile
 from src.utils.is_wire import RequestManager
-from src.utils.video import VideoIterator
-from src.utils.image import get_pb_image
+from src.utils.video import VideoIterator, video_frames
+from src.utils.frame_archive import FrameArchive, is_archive_file, get_archive_camera_id
+from src.utils.encoding import Encoder, EncodingPool, IMAGE_ENCODER_BACKENDS
+from src.utils.encoding import scaled_resolution
+from src.utils.sinks import CsvSink, SubsampledSink, completed_sample_ids, is_complete
+from src.utils.subsampling import stride_frames, skip_static_frames
+from src.utils.cache import DetectionCache, config_hash
+from src.utils.pipeline import FramePipeline
+from src.utils.shared_memory import SharedFrame
 
 from src.panoptic_dataset.utils import is_video_file, get_camera_id, make_df_columns
-from src.utils.is_msgs import object_annotations_to_np
+from src.utils.is_msgs import object_annotations_to_np, scale_object_annotations
 
 log = Logger(name='SkeletonDetection')
 
 
 def main(sequence_folder, output_folder, info_folder, pose_model, broker_uri, zipkin_uri,
-         min_requests, max_requests, timeout_ms):
+         min_requests, max_requests, timeout_ms, prefetch_depth, encoder, quality,
+         send_height, encode_workers, encode_processes, concurrent_cameras, decode_segments,
+         archive_folder, cache_file, cache_size_mb, detector_config, resume, stride,
+         skip_threshold):
+
+    if concurrent_cameras < 1:
+        log.critical("'--concurrent-cameras' must be at least 1, got {}.", concurrent_cameras)
 
     _, _, video_files = next(walk(sequence_folder))
     video_files = list(filter(is_video_file, video_files))
@@ -39,9 +51,10 @@ def main(sequence_folder, output_folder, info_folder, pose_model, broker_uri, zi
         begin_id, end_id = sequence_info['begin'], sequence_info['end']
     
     output_folder_path = join(output_folder, sequence_name, '2d_annotations', pose_model)
-    if exists(output_folder_path):
+    if exists(output_folder_path) and not resume:
         rmtree(output_folder_path)
-    makedirs(output_folder_path)
+    if not exists(output_folder_path):
+        makedirs(output_folder_path)
 
     channel = Channel(broker_uri)
     zipkin_exporter = None
@@ -61,68 +74,241 @@ def main(sequence_folder, output_folder, info_folder, pose_model, broker_uri, zi
         max_requests=max_requests,
         min_requests=min_requests)
 
-    for video_file in video_files:
-        video_file_path = join(sequence_folder, video_file)
+    encoding_pool = EncodingPool(
+        encoder=Encoder(backend=encoder, quality=quality, height=send_height),
+        workers=encode_workers,
+        processes=encode_processes)
+
+    cache = None
+    if cache_file is not None:
+        cache = DetectionCache(cache_file, max_size=cache_size_mb * 2**20)
+        if detector_config is None:
+            log.warn("Detector configuration not specified, cached detections will only be "
+                     "distinguished by encoding options.")
+
+    if skip_threshold is not None and archive_folder is not None:
+        log.warn("Frames read from archives are already encoded, '--skip-threshold' ignored.")
+        skip_threshold = None
+
+    columns = make_df_columns(pose_model, has_z=False)
+    sinks, pipelines, archives = {}, {}, {}
+    # stage reporting the reading stats of each camera, i.e. its pipeline or archive iterator
+    meters = {}
+    # factors to bring keypoints from the sent image back to the video resolution
+    scale_factors = {}
+    # number of requests waiting for a reply of each camera
+    n_pending = defaultdict(int)
+    # (sample_id, data) pairs of each camera with detections on cache, not served yet
+    cached = {}
+    # cache key of each camera, from the detector configuration and the images it receives
+    detector_hashes = {}
+
+    if archive_folder is not None:
+        archives_folder_path = join(archive_folder, sequence_name, 'frames')
+        _, _, archive_files = next(walk(archives_folder_path))
+        cameras_to_process = [(get_archive_camera_id(file), join(archives_folder_path, file))
+                              for file in sorted(filter(is_archive_file, archive_files))]
+    else:
+        cameras_to_process = [(get_camera_id(file), join(sequence_folder, file))
+                              for file in video_files]
+
+    def output_file_path(camera_id):
+        return join(output_folder_path, '{}.csv'.format(camera_id))
+
+    if resume:
+        completed = [x for x in cameras_to_process if is_complete(output_file_path(x[0]))]
+        for camera_id, _ in completed:
+            log.info("[{}][{}] Already completed. Skipping.", sequence_name, camera_id)
+        cameras_to_process = [x for x in cameras_to_process if x not in completed]
+
+    def save_detections(localizations, sample_id, camera_id):
+        fx, fy = scale_factors[camera_id]
+        if fx != 1.0 or fy != 1.0:
+            scale_object_annotations(localizations, fx, fy)
 
-        video_iterator = VideoIterator(video_file_path)
+        localizations_array = object_annotations_to_np(
+            annotations_pb=localizations,
+            model=pose_model,
+            has_z=False,
+            add_person_id=True,
+            sample_id=sample_id)
+        sinks[camera_id].write(sample_id, localizations_array)
+
+    def on_detections(msg, received_metadata):
+        received_sample_id = received_metadata['sample_id']
+        received_camera_id = received_metadata['camera_id']
+        if cache is not None:
+            cache.put(sequence_name, received_camera_id, received_sample_id,
+                      detector_hashes[received_camera_id], msg.body)
+
+        save_detections(msg.unpack(ObjectAnnotations), received_sample_id, received_camera_id)
+        n_pending[received_camera_id] -= 1
+
+        log.info("[{}][{}][{:<3s}] {}", sequence_name, received_camera_id, "<<",
+                 received_sample_id)
+
+    def serve_cached(camera_id, before_id=None):
+        cached_detections = cached.get(camera_id, deque())
+        while len(cached_detections) > 0 and (before_id is None
+                                              or cached_detections[0][0] < before_id):
+            sample_id, data = cached_detections.popleft()
+            save_detections(ObjectAnnotations.FromString(data), sample_id, camera_id)
+
+    request_manager.add_reply_handler("SkeletonsDetector.Detect", on_detections)
+
+    def skip_samples(frames, skipped_ids):
+        for sample_id, frame in frames:
+            if sample_id in skipped_ids:
+                if isinstance(frame, SharedFrame):
+                    frame.release()
+                continue
+            if cache is not None:
+                cache.count_miss()
+            yield sample_id, frame
+
+    def start_next_camera():
+        camera_id, file_path = cameras_to_process.pop(0)
         it_range = range(begin_id, end_id + 1)
-        data_iterator = zip(it_range, video_iterator.in_range(it_range))
 
-        received_data = []
-        camera_id = get_camera_id(video_file)
-        end_of_data = False
+        if archive_folder is not None:
+            # frames already encoded, just read from the archive
+            archives[camera_id] = FrameArchive(file_path)
+            metadata = archives[camera_id].metadata()
+            resolution, sent_resolution = metadata['resolution'], metadata['sent_resolution']
+            encoding = {'encoder': metadata['encoder'], 'quality': metadata['quality']}
+        else:
+            resolution = VideoIterator(file_path).resolution()
+            sent_resolution = scaled_resolution(resolution, send_height)
+            encoding = {'encoder': encoder, 'quality': quality}
+        # same key for archived and locally encoded frames, where they came from doesn't matter
+        detector_hashes[camera_id] = config_hash(
+            detector_config, sent_resolution=list(sent_resolution), **encoding)
+
+        # samples saved by a previous run, or with detections on cache, won't be sent
+        skipped_ids = completed_sample_ids(output_file_path(camera_id)) if resume else set()
+        if cache is not None:
+            # payloads are taken now, so they can't be evicted by the replies of this run
+            cached[camera_id] = deque(cache.cached_detections(
+                sequence_name, camera_id, detector_hashes[camera_id], it_range,
+                skip=skipped_ids))
+            skipped_ids = skipped_ids.union(sample_id for sample_id, _ in cached[camera_id])
+        # seek directly to the first frame to be sent
+        first_id = next((x for x in it_range if x not in skipped_ids), it_range.stop)
+        frames_range = range(first_id, it_range.stop)
+
+        def subsample(frames):
+            # frames not to be sent are replaced by None
+            if skip_threshold is not None:
+                frames = skip_static_frames(frames, skip_threshold)
+            if stride > 1:
+                frames = stride_frames(frames, stride, last_id=end_id)
+            return frames
 
-        while True:
+        if archive_folder is not None:
+            meters[camera_id] = archives[camera_id].in_range(frames_range)
+            pipelines[camera_id] = subsample(skip_samples(meters[camera_id], skipped_ids))
+        else:
+            # sinks reorder the detections, only subsampling needs frames in order
+            frames, _ = video_frames(
+                file_path,
+                frames_range,
+                n_segments=decode_segments,
+                ordered=stride > 1 or skip_threshold is not None,
+                skip=skipped_ids)
+            pipelines[camera_id] = FramePipeline(
+                frames=subsample(skip_samples(frames, skipped_ids)),
+                pool=encoding_pool,
+                depth=prefetch_depth).start()
+            meters[camera_id] = pipelines[camera_id]
+
+        scale_factors[camera_id] = (resolution[0] / sent_resolution[0],
+                                    resolution[1] / sent_resolution[1])
+
+        sinks[camera_id] = CsvSink(
+            output_file_path(camera_id),
+            columns,
+            first_sample_id=begin_id,
+            checkpoint=True,
+            resume=resume)
+        if stride > 1 or skip_threshold is not None:
+            sinks[camera_id] = SubsampledSink(
+                sinks[camera_id],
+                first_sample_id=begin_id,
+                n_columns=len(columns),
+                interpolate=stride > 1,
+                skip=completed_sample_ids(output_file_path(camera_id)) if resume else None,
+                cached=[sample_id for sample_id, _ in cached.get(camera_id, [])])
+        log.info("[{}][{}] Processing '{}'", sequence_name, camera_id, file_path)
+
+    while True:
+
+        while len(pipelines) < concurrent_cameras and len(cameras_to_process) > 0:
+            start_next_camera()
+
+        # interleave frames from all cameras being processed, one of each at a time
+        while request_manager.can_request() and len(pipelines) > 0:
+            for camera_id in list(pipelines.keys()):
+                if not request_manager.can_request():
+                    break
 
-            while request_manager.can_request() and not end_of_data:
                 try:
-                    sample_id, frame = next(data_iterator)
+                    sample_id, request = next(pipelines[camera_id])
                 except StopIteration:
-                    end_of_data = True
-                    break
+                    pipelines.pop(camera_id)
+                    if camera_id in archives:
+                        archives.pop(camera_id).close()
+                    if cache is not None:
+                        serve_cached(camera_id)
+                    log.info("[{}][{}] {}", sequence_name, camera_id, ', '.join(
+                        '{}: {:.1f}'.format(key, value)
+                        for key, value in meters.pop(camera_id).stats().items()))
+                    if len(cameras_to_process) > 0:
+                        start_next_camera()
+                    continue
+
+                if cache is not None:
+                    serve_cached(camera_id, before_id=sample_id)
+
+                if request is None:
+                    sinks[camera_id].skip(sample_id)
+                    continue
 
-                request = get_pb_image(frame)
                 metadata = {
                     "sample_id": sample_id,
                     "camera_id": camera_id,
                     "sequence": sequence_name,
                 }
                 request_manager.request(
-                    content=request,
+                    content=Image(data=request),
                     topic="SkeletonsDetector.Detect",
                     timeout_ms=timeout_ms,
                     metadata=metadata)
+                n_pending[camera_id] += 1
 
                 log.info("[{}][{}][{:>3s}] {}", sequence_name, camera_id, ">>", sample_id)
 
-            received_msgs = request_manager.consume_ready(timeout=1.0)
+        # only wait for replies while requests are in flight
+        request_manager.consume_ready(timeout=0.0 if request_manager.all_received() else 1.0)
 
-            for msg, received_metadata in received_msgs:
-                localizations = msg.unpack(ObjectAnnotations)
-                received_sample_id = received_metadata['sample_id']
+        for camera_id in list(sinks.keys()):
+            if camera_id in pipelines or n_pending[camera_id] > 0:
+                continue
+            sink = sinks.pop(camera_id)
+            sink.close()
+            log.info("[{}][{}] All received. Results saved on {}", sequence_name, camera_id,
+                     sink.file_path())
+            if hasattr(sink, 'stats'):
+                log.info("[{}][{}] {}", sequence_name, camera_id, ', '.join(
+                    '{}: {}'.format(key, value) for key, value in sink.stats().items()))
 
-                localizations_array = object_annotations_to_np(
-                    annotations_pb=localizations,
-                    model=pose_model,
-                    has_z=False,
-                    add_person_id=True,
-                    sample_id=received_sample_id)
-                received_data.append(localizations_array)
-
-                log.info("[{}][{}][{:<3s}] {}", sequence_name, camera_id, "<<", received_sample_id)
-
-            if request_manager.all_received() and end_of_data:
-                log.info("All received.")
-                received_data = np.vstack(received_data)
-                columns = make_df_columns(pose_model, has_z=False)
-                df = pd.DataFrame(data=received_data, columns=columns)
-                df.sort_values(by=['sample_id', 'person_id'], axis='rows', inplace=True)
-
-                output_file_path = join(output_folder_path, '{}.csv'.format(camera_id))
-                log.info("Saving results on {}", output_file_path)
-                df.to_csv(path_or_buf=output_file_path, header=True, index=False)
-
-                break
+        if len(sinks) == 0 and len(cameras_to_process) == 0:
+            log.info("All received.")
+            encoding_pool.shutdown()
+            if cache is not None:
+                log.info("Cache: {}", ', '.join(
+                    '{}: {}'.format(key, value) for key, value in cache.stats().items()))
+                cache.close()
+            break
 
 
 if __name__ == '__main__':
@@ -186,6 +372,113 @@ if __name__ == '__main__':
         default=5000,
         help="""ResquestManager parameter. Amount of time to a sent message receive a 
         response. In case of reach this deadline, RequestManager will retry indefinitely.""")
+    parser.add_argument(
+        '--prefetch-depth',
+        type=int,
+        required=False,
+        default=32,
+        help="""Maximum number of frames decoded and encoded ahead of the requests, 
+        waiting on a queue to be sent.""")
+    parser.add_argument(
+        '--encode-workers',
+        type=int,
+        required=False,
+        default=2,
+        help="""Number of background workers encoding frames before sending them.""")
+    parser.add_argument(
+        '--encode-processes',
+        action='store_true',
+        help="""Encode frames on a pool of processes instead of threads.""")
+    parser.add_argument(
+        '--encoder',
+        type=str,
+        required=False,
+        default='opencv',
+        choices=IMAGE_ENCODER_BACKENDS,
+        help="""Backend used to encode frames. 'opencv' and 'turbojpeg' produce JPEG images,
+        the latter requires PyTurboJPEG to be installed.""")
+    parser.add_argument(
+        '--quality',
+        type=float,
+        required=False,
+        default=0.8,
+        help="""Encoding quality, from 0.0 to 1.0. Mapped to JPEG quality or to PNG 
+        compression level.""")
+    parser.add_argument(
+        '--send-height',
+        type=int,
+        required=False,
+        help="""If specified, frames are downscaled to this height, keeping the aspect ratio,
+        before being encoded and sent. Usually set to the detector network resolution height.
+        Received keypoints are rescaled back to the original video resolution.""")
+    parser.add_argument(
+        '--concurrent-cameras',
+        type=int,
+        required=False,
+        default=1,
+        help="""Number of camera videos processed at the same time. Frames from these cameras
+        are interleaved on the same request window, and a new camera starts as soon as all 
+        frames of another one were sent, keeping the detectors busy until the end of the 
+        sequence. Detections are still saved on a file for each camera.""")
+    parser.add_argument(
+        '--decode-segments',
+        type=int,
+        required=False,
+        default=1,
+        help="""Number of segments in which the frames of each video are split. Each segment
+        is decoded on its own process, and frames are transferred through shared memory.
+        Frames are sent as soon as they're decoded, out of order, unless '--stride' or
+        '--skip-threshold' are used.""")
+    parser.add_argument(
+        '--archive-folder',
+        type=str,
+        required=False,
+        help="""Path to folder with frames already encoded by 'bin.extract_frames', inside a
+        'frames' folder of each sequence. If specified, frames are read from these archives 
+        instead of decoding and encoding videos, and encoding options are ignored.""")
+    parser.add_argument(
+        '--cache-file',
+        type=str,
+        required=False,
+        help="""SQLite file to cache received detections. If specified, frames already 
+        detected with the same detector configuration and encoding options, either set here
+        or stored on the archives, are served from the cache instead of being sent to the
+        detector.""")
+    parser.add_argument(
+        '--cache-size-mb',
+        type=int,
+        required=False,
+        default=1024,
+        help="""Maximum size of the cache. Least recently used detections are evicted when
+        this size is exceeded.""")
+    parser.add_argument(
+        '--detector-config',
+        type=str,
+        required=False,
+        help="""Detector configuration file, e.g. a 'detector.yaml' from the experiments
+        folder. Its content is part of the key of cached detections.""")
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="""Resume a previous run that didn't finish. Detections are saved periodically,
+        and samples already saved aren't sent again. Cameras already completed are skipped.""")
+
+    parser.add_argument(
+        '--stride',
+        type=int,
+        required=False,
+        default=1,
+        help="""Send only one of every 'stride' frames to the detector. Keypoints of the frames
+        in between are interpolated from the detections of the sent frames around them,
+        matching skeletons by the distance between their joints. The accuracy impact can be
+        measured against a run with all frames using 'bin.metrics.compare_detections'.""")
+    parser.add_argument(
+        '--skip-threshold',
+        type=float,
+        required=False,
+        help="""If specified, frames whose mean absolute difference, on a downsampled gray
+        scale image, from the last frame sent is below this threshold (from 0 to 255) aren't
+        sent, and take the detections of that frame. Not available with '--archive-folder'.""")
 
     args = parser.parse_args()
 
@@ -198,4 +491,19 @@ if __name__ == '__main__':
         zipkin_uri=args.zipkin_uri,
         min_requests=args.min_requests,
         max_requests=args.max_requests,
-        timeout_ms=args.timeout_ms)
+        timeout_ms=args.timeout_ms,
+        prefetch_depth=args.prefetch_depth,
+        encoder=args.encoder,
+        quality=args.quality,
+        send_height=args.send_height,
+        encode_workers=args.encode_workers,
+        encode_processes=args.encode_processes,
+        concurrent_cameras=args.concurrent_cameras,
+        decode_segments=args.decode_segments,
+        archive_folder=args.archive_folder,
+        cache_file=args.cache_file,
+        cache_size_mb=args.cache_size_mb,
+        detector_config=args.detector_config,
+        resume=args.resume,
+        stride=args.stride,
+        skip_threshold=args.skip_threshold)
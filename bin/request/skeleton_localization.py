@@ -4,7 +4,6 @@ from os import makedirs, walk
 from os.path import join, dirname, exists, basename
 from shutil import rmtree
 from urllib.parse import urlparse
-import numpy as np
 import pandas as pd
 
 from is_wire.core import Channel, Logger
@@ -13,14 +12,17 @@ from is_msgs.image_pb2 import ObjectAnnotations
 from src.utils.arparse import ArgumentParserFile
 from src.utils.proto.group_request_pb2 import MultipleObjectAnnotations
 from src.utils.is_wire import RequestManager
+from src.utils.sinks import CsvSink, completed_sample_ids, is_complete
 from src.utils.is_msgs import data_frame_to_object_annotations, object_annotations_to_np
 from src.panoptic_dataset.utils import is_valid_model, make_df_columns, RESOLUTION
+from src.reconstruction.cameras import load_cameras
+from src.reconstruction.grouper import SkeletonsGrouper
 
 log = Logger(name='SkeletonLocalization')
 
 
 def main(sequence_folder, info_folder, output_folder, pose_model, cameras, broker_uri, zipkin_uri,
-         min_requests, max_requests, timeout_ms):
+         min_requests, max_requests, timeout_ms, resume, calibrations_folder):
 
     info_file_path = join(info_folder if info_folder is not None else sequence_folder, 'info.json')
     if not exists(info_file_path):
@@ -66,28 +68,84 @@ def main(sequence_folder, info_folder, output_folder, pose_model, cameras, broke
         return m_obj_annotations
 
     sample_ids = list(range(sequence_info['begin'], sequence_info['end'] + 1))
+    sequence_name = basename(dirname(sequence_folder + '/'))
 
-    channel = Channel(broker_uri)
-    zipkin_exporter = None
+    grouper, request_manager = None, None
+    if calibrations_folder is not None:
+        try:
+            grouper = SkeletonsGrouper(
+                load_cameras(join(calibrations_folder, sequence_name, 'calibrations'), cameras))
+        except Exception as ex:
+            log.critical(str(ex))
+    else:
+        channel = Channel(broker_uri)
+        zipkin_exporter = None
 
-    if zipkin_uri is not None:
-        zipkin_uri = urlparse(zipkin_uri)
-        zipkin_exporter = ZipkinExporter(
-            service_name="RequestSkeletonsLocalization",
-            host_name=zipkin_uri.hostname,
-            port=zipkin_uri.port,
-            transport=BackgroundThreadTransport(max_batch_size=100),
-        )
+        if zipkin_uri is not None:
+            zipkin_uri = urlparse(zipkin_uri)
+            zipkin_exporter = ZipkinExporter(
+                service_name="RequestSkeletonsLocalization",
+                host_name=zipkin_uri.hostname,
+                port=zipkin_uri.port,
+                transport=BackgroundThreadTransport(max_batch_size=100),
+            )
 
-    request_manager = RequestManager(
-        channel=channel,
-        zipkin_exporter=zipkin_exporter,
-        max_requests=max_requests,
-        min_requests=min_requests)
+        request_manager = RequestManager(
+            channel=channel,
+            zipkin_exporter=zipkin_exporter,
+            max_requests=max_requests,
+            min_requests=min_requests)
 
-    sequence_name = basename(dirname(sequence_folder + '/'))
     experiment_name = basename(dirname(output_folder + '/'))
-    received_data = []
+
+    output_folder_path = join(output_folder, sequence_name, pose_model)
+    if exists(output_folder_path) and not resume:
+        rmtree(output_folder_path)
+    if not exists(output_folder_path):
+        makedirs(output_folder_path)
+    output_file_path = join(output_folder_path, 'data.csv')
+
+    if resume:
+        if is_complete(output_file_path):
+            log.info("'{}' already completed. Exiting.", output_file_path)
+            return
+        done_ids = completed_sample_ids(output_file_path)
+        log.info("Resuming, {} samples already done.", len(done_ids))
+
+    sink = CsvSink(
+        output_file_path,
+        columns=make_df_columns(pose_model),
+        first_sample_id=sample_ids[0],
+        checkpoint=True,
+        resume=resume)
+    if resume:
+        sample_ids = [sample_id for sample_id in sample_ids if sample_id not in done_ids]
+
+    def save_localizations(localizations, sample_id):
+        localizations_array = object_annotations_to_np(
+            annotations_pb=localizations,
+            model=pose_model,
+            has_z=True,
+            add_person_id=True,
+            sample_id=sample_id)
+        sink.write(sample_id, localizations_array)
+
+        log.info("[{}] [{:<3s}] {}", sequence_name, "<<", sample_id)
+
+    if grouper is not None:
+        # same messages as the service, localized by the local grouper
+        for sample_id in sample_ids:
+            request = make_request(sample_id)
+            save_localizations(grouper.group_annotations(request.list, pose_model), sample_id)
+        sink.close()
+        log.info("Results saved on {}", output_file_path)
+        return
+
+    def on_localizations(msg, received_metadata):
+        save_localizations(msg.unpack(ObjectAnnotations), received_metadata['sample_id'])
+
+    request_manager.add_reply_handler("SkeletonsGrouper.Localize", on_localizations)
+
     while True:
 
         while request_manager.can_request() and len(sample_ids) > 0:
@@ -105,37 +163,12 @@ def main(sequence_folder, info_folder, output_folder, pose_model, cameras, broke
                 metadata=metadata)
             log.info("[{}] [{:>3s}] {}", sequence_name, ">>", sample_id)
 
-        received_msgs = request_manager.consume_ready(timeout=1.0)
-
-        for msg, received_metadata in received_msgs:
-            localizations = msg.unpack(ObjectAnnotations)
-            received_sample_id = received_metadata['sample_id']
-
-            localizations_array = object_annotations_to_np(
-                annotations_pb=localizations,
-                model=pose_model,
-                has_z=True,
-                add_person_id=True,
-                sample_id=received_sample_id)
-            received_data.append(localizations_array)
-
-            log.info("[{}] [{:<3s}] {}", sequence_name, "<<", received_sample_id)
+        request_manager.consume_ready(timeout=1.0)
 
         if request_manager.all_received() and len(sample_ids) == 0:
             log.info("All received.")
-            received_data = np.vstack(received_data)
-            df = pd.DataFrame(data=received_data, columns=make_df_columns(pose_model))
-            df.sort_values(by=['sample_id', 'person_id'], axis='rows', inplace=True)
-
-            output_folder_path = join(output_folder, sequence_name, pose_model)
-            if exists(output_folder_path):
-                rmtree(output_folder_path)
-            makedirs(output_folder_path)
-            output_file_path = join(output_folder_path, 'data.csv')
-
-            log.info("Saving results on {}", output_file_path)
-            df.to_csv(path_or_buf=output_file_path, header=True, index=False)
-
+            sink.close()
+            log.info("Results saved on {}", output_file_path)
             break
 
 
@@ -212,6 +245,19 @@ if __name__ == '__main__':
         default=1000,
         help="""ResquestManager parameter. Amount of time to a sent message receive a 
         response. In case of reach this deadline, RequestManager will retry indefinitely.""")
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="""Resume a previous run that didn't finish. Localizations are saved periodically,
+        and samples already saved aren't requested again.""")
+    parser.add_argument(
+        '--calibrations-folder',
+        type=str,
+        required=False,
+        help="""Path to folder containing a folder with the name of each sequence, and inside
+        that a 'calibrations' folder with a JSON calibration file for each camera. If
+        specified, the same requests are localized by a local 'SkeletonsGrouper', with its
+        default parameters, instead of the service, and the broker isn't used.""")
 
     args = parser.parse_args()
 
@@ -225,4 +271,6 @@ if __name__ == '__main__':
         zipkin_uri=args.zipkin_uri,
         min_requests=args.min_requests,
         max_requests=args.max_requests,
-        timeout_ms=args.timeout_ms)
+        timeout_ms=args.timeout_ms,
+        resume=args.resume,
+        calibrations_folder=args.calibrations_folder)
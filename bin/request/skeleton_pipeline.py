@@ -0,0 +1,396 @@
+import json
+import time
+from collections import deque
+from os import makedirs, walk
+from os.path import join, dirname, exists, basename
+from shutil import rmtree
+from urllib.parse import urlparse
+import numpy as np
+
+from is_wire.core import Channel, Logger
+from is_wire.core import ZipkinExporter, BackgroundThreadTransport
+from is_msgs.image_pb2 import Image, ObjectAnnotations
+from src.utils.arparse import ArgumentParserFile
+from src.utils.proto.group_request_pb2 import MultipleObjectAnnotations
+from src.utils.is_wire import RequestManager
+from src.utils.video import MultiVideoIterator, VideoIterator
+from src.utils.encoding import Encoder, EncodingPool, IMAGE_ENCODER_BACKENDS
+from src.utils.encoding import scaled_resolution
+from src.utils.pipeline import FramePipeline
+from src.utils.sinks import CsvSink
+
+from src.panoptic_dataset.utils import is_video_file, get_camera_id, is_valid_model
+from src.panoptic_dataset.utils import make_df_columns
+from src.utils.is_msgs import object_annotations_to_np, scale_object_annotations
+
+log = Logger(name='SkeletonPipeline')
+
+
+def main(sequence_folder, info_folder, output_folder, pose_model, cameras, broker_uri,
+         zipkin_uri, min_requests, max_requests, max_localize_requests, max_pending_samples,
+         detection_timeout_ms, localization_timeout_ms, encoder, quality, send_height,
+         encode_workers, encode_processes, lookahead, realtime):
+
+    try:
+        is_valid_model(pose_model)
+    except Exception as ex:
+        log.critical(str(ex))
+
+    sequence_name = basename(dirname(sequence_folder + '/'))
+    experiment_name = basename(dirname(output_folder + '/'))
+
+    info_file_path = join(info_folder, sequence_name, 'info.json')
+    if not exists(info_file_path):
+        log.critical("'{}' file doesn't exist.", info_file_path)
+    with open(info_file_path) as f:
+        sequence_info = json.load(f)
+    begin_id, end_id = sequence_info['begin'], sequence_info['end']
+
+    _, _, video_files = next(walk(sequence_folder))
+    videos = {
+        get_camera_id(file): join(sequence_folder, file)
+        for file in filter(is_video_file, video_files)
+    }
+    if cameras is not None:
+        not_available_cameras = set(cameras).difference(videos.keys())
+        if len(not_available_cameras) > 0:
+            log.critical("For sequence {}, video(s) of camera(s) {} are not available.",
+                         sequence_name, ', '.join(map(str, sorted(not_available_cameras))))
+        videos = {camera_id: videos[camera_id] for camera_id in cameras}
+
+    output_folder_path = join(output_folder, sequence_name, pose_model)
+    if exists(output_folder_path):
+        rmtree(output_folder_path)
+    makedirs(output_folder_path)
+    output_file_path = join(output_folder_path, 'data.csv')
+
+    zipkin_exporter = None
+    if zipkin_uri is not None:
+        zipkin_uri = urlparse(zipkin_uri)
+        zipkin_exporter = ZipkinExporter(
+            service_name="SkeletonsPipeline",
+            host_name=zipkin_uri.hostname,
+            port=zipkin_uri.port,
+            transport=BackgroundThreadTransport(max_batch_size=100),
+        )
+
+    # each stage has its own channel, a manager ignores replies to requests it didn't make
+    detection_manager = RequestManager(
+        channel=Channel(broker_uri),
+        zipkin_exporter=zipkin_exporter,
+        max_requests=max_requests,
+        min_requests=min_requests)
+    localization_manager = RequestManager(
+        channel=Channel(broker_uri),
+        zipkin_exporter=zipkin_exporter,
+        max_requests=max_localize_requests,
+        min_requests=0)
+
+    frames = MultiVideoIterator(videos, range(begin_id, end_id + 1), lookahead=lookahead)
+    all_cameras = frames.cameras()
+    resolutions = frames.resolutions()
+    fps = VideoIterator(videos[all_cameras[0]]).fps()
+    # factors to bring keypoints from the sent image back to the video resolution
+    scale_factors = {}
+    for camera_id, resolution in resolutions.items():
+        sent_resolution = scaled_resolution(resolution, send_height)
+        scale_factors[camera_id] = (resolution[0] / sent_resolution[0],
+                                    resolution[1] / sent_resolution[1])
+
+    def camera_frames():
+        # the number of cameras of each sample goes along with its frames
+        for sample_id, bundle in frames:
+            for camera_id, frame in bundle.items():
+                yield (sample_id, camera_id, len(bundle)), frame
+
+    encoding_pool = EncodingPool(
+        encoder=Encoder(backend=encoder, quality=quality, height=send_height),
+        workers=encode_workers,
+        processes=encode_processes)
+    pipeline = FramePipeline(frames=camera_frames(), pool=encoding_pool).start()
+
+    sink = CsvSink(output_file_path, columns=make_df_columns(pose_model), first_sample_id=begin_id)
+
+    # samples with frames sent to the detector and not localized yet
+    in_flight = {}
+    # samples with detections of all cameras, waiting to be localized
+    detected = deque()
+    latencies = []
+    n_samples = 0
+
+    def on_detections(msg, received_metadata):
+        sample_id = received_metadata['sample_id']
+        camera_id = received_metadata['camera_id']
+
+        annotations = msg.unpack(ObjectAnnotations)
+        fx, fy = scale_factors[camera_id]
+        if fx != 1.0 or fy != 1.0:
+            scale_object_annotations(annotations, fx, fy)
+        annotations.frame_id = camera_id
+        annotations.resolution.width, annotations.resolution.height = resolutions[camera_id]
+
+        sample = in_flight[sample_id]
+        sample['detections'][camera_id] = annotations
+        if len(sample['detections']) == sample['n_cameras']:
+            detected.append(sample_id)
+
+        log.debug("[{}][{}][{:<3s}] {}", sequence_name, camera_id, "<<", sample_id)
+
+    def on_localizations(msg, received_metadata):
+        sample_id = received_metadata['sample_id']
+        localizations_array = object_annotations_to_np(
+            annotations_pb=msg.unpack(ObjectAnnotations),
+            model=pose_model,
+            has_z=True,
+            add_person_id=True,
+            sample_id=sample_id)
+        sink.write(sample_id, localizations_array)
+
+        sample = in_flight.pop(sample_id)
+        latencies.append(time.time() - sample['started_at'])
+        log.info("[{}] [{:<3s}] {}", sequence_name, "<<", sample_id)
+
+    detection_manager.add_reply_handler("SkeletonsDetector.Detect", on_detections)
+    localization_manager.add_reply_handler("SkeletonsGrouper.Localize", on_localizations)
+
+    def localize(sample_id):
+        detections = in_flight[sample_id]['detections']
+        request = MultipleObjectAnnotations()
+        for camera_id in all_cameras:
+            # cameras whose video already ended go without detections
+            annotations = detections.get(camera_id, ObjectAnnotations(frame_id=camera_id))
+            request.list.add().CopyFrom(annotations)
+
+        metadata = {
+            "sample_id": sample_id,
+            "experiment": experiment_name,
+            "sequence": sequence_name,
+        }
+        localization_manager.request(
+            content=request,
+            topic="SkeletonsGrouper.Localize",
+            timeout_ms=localization_timeout_ms,
+            metadata=metadata)
+        log.info("[{}] [{:>3s}] {}", sequence_name, ">>", sample_id)
+
+    started_at = time.time()
+    next_frame = None
+    while True:
+
+        while pipeline is not None and detection_manager.can_request():
+            if next_frame is None:
+                try:
+                    next_frame = next(pipeline)
+                except StopIteration:
+                    log.info("[{}] All frames sent. {}", sequence_name, ', '.join(
+                        '{}: {:.1f}'.format(key, value)
+                        for key, value in pipeline.stats().items()))
+                    pipeline = None
+                    break
+
+            (sample_id, camera_id, n_cameras), payload = next_frame
+            if sample_id not in in_flight:
+                # backpressure, don't start a sample while others are waiting for the grouper
+                if len(in_flight) >= max_pending_samples:
+                    break
+                # when the frames would have been captured by live cameras
+                captured_at = started_at + (sample_id - begin_id) / fps
+                if realtime and time.time() < captured_at:
+                    break
+                in_flight[sample_id] = {
+                    'n_cameras': n_cameras,
+                    'detections': {},
+                    'started_at': captured_at if realtime else time.time(),
+                }
+                n_samples += 1
+
+            metadata = {
+                "sample_id": sample_id,
+                "camera_id": camera_id,
+                "sequence": sequence_name,
+            }
+            detection_manager.request(
+                content=Image(data=payload),
+                topic="SkeletonsDetector.Detect",
+                timeout_ms=detection_timeout_ms,
+                metadata=metadata)
+            next_frame = None
+            log.debug("[{}][{}][{:>3s}] {}", sequence_name, camera_id, ">>", sample_id)
+
+        detection_manager.consume_ready(timeout=0.01)
+
+        while localization_manager.can_request() and len(detected) > 0:
+            localize(detected.popleft())
+
+        localization_manager.consume_ready(timeout=0.01)
+
+        if pipeline is None and len(in_flight) == 0:
+            log.info("All received.")
+            sink.close()
+            log.info("Results saved on {}", output_file_path)
+            encoding_pool.shutdown()
+            # every sample read from the videos must have been localized and saved
+            if sink.n_written_samples() != n_samples:
+                log.critical("{} samples were read from the videos, but {} were saved.",
+                             n_samples, sink.n_written_samples())
+            break
+
+    latencies = np.array(latencies) * 1000.0
+    if latencies.size > 0:
+        log.info("Frame to 3D latency: mean {:.1f} ms, p95 {:.1f} ms, {:.1f} samples/s",
+                 latencies.mean(), np.percentile(latencies, 95),
+                 latencies.size / (time.time() - started_at))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParserFile(parse_from_file=True)
+    parser.add_argument(
+        '--sequence-folder',
+        type=str,
+        required=True,
+        help="""Path to folder containing a sequence from CMU Panoptic dataset.
+        This folder must have MP4 files named with the pattern 'hd_00_{camera_id:02d}.mp4'.""")
+    parser.add_argument(
+        '--info-folder',
+        type=str,
+        required=True,
+        help="""Path to folder, containing a folder inside with the sequence name,
+        and inside that a 'info.json' with begin and end ids of the sequence.""")
+    parser.add_argument(
+        '--output-folder',
+        type=str,
+        required=True,
+        help="""Path to folder to save a data.csv file with results.
+        A folder with the sequence name and another inside that with the
+        pose model will be created to save this file.""")
+    parser.add_argument(
+        '--pose-model',
+        type=str,
+        required=False,
+        default='joints19',
+        help="""You can specify what model to process, can be either 'joints15'
+        or 'joints19'.""")
+    parser.add_argument(
+        '--cameras',
+        type=int,
+        required=False,
+        nargs='+',
+        help="""Cameras used to localize skeletons. Must be the same cameras known by the
+        SkeletonsGrouper service. If not specified, all videos will be processed.""")
+    parser.add_argument(
+        '--broker-uri',
+        type=str,
+        required=False,
+        default='amqp://localhost:5672',
+        help="""RabbitMQ Broker URI to connect and send requests to SkeletonsDetector.Detect
+        and SkeletonsGrouper.Localize.""")
+    parser.add_argument(
+        '--zipkin-uri',
+        type=str,
+        required=False,
+        help="""Zipkin URI to export tracings from requests.""")
+    parser.add_argument(
+        '--min-requests',
+        type=int,
+        required=False,
+        default=0,
+        help="""ResquestManager parameter of detection requests. Number of minimum requests
+        to have on queue waiting for a response.""")
+    parser.add_argument(
+        '--max-requests',
+        type=int,
+        required=False,
+        default=100,
+        help="""ResquestManager parameter of detection requests. Number of maximum requests
+        to have on queue waiting for a response.""")
+    parser.add_argument(
+        '--max-localize-requests',
+        type=int,
+        required=False,
+        default=10,
+        help="""Number of maximum localization requests waiting for a response.""")
+    parser.add_argument(
+        '--max-pending-samples',
+        type=int,
+        required=False,
+        default=20,
+        help="""Maximum number of samples sent to the detector and not localized yet. When
+        the grouper falls behind, no frames of new samples are sent to the detector.""")
+    parser.add_argument(
+        '--detection-timeout-ms',
+        type=int,
+        required=False,
+        default=5000,
+        help="""Amount of time to a detection request receive a response, before being
+        sent again.""")
+    parser.add_argument(
+        '--localization-timeout-ms',
+        type=int,
+        required=False,
+        default=1000,
+        help="""Amount of time to a localization request receive a response, before being
+        sent again.""")
+    parser.add_argument(
+        '--encoder',
+        type=str,
+        required=False,
+        default='opencv',
+        choices=IMAGE_ENCODER_BACKENDS,
+        help="""Backend used to encode frames.""")
+    parser.add_argument(
+        '--quality',
+        type=float,
+        required=False,
+        default=0.8,
+        help="""Encoding quality, from 0.0 to 1.0.""")
+    parser.add_argument(
+        '--send-height',
+        type=int,
+        required=False,
+        help="""If specified, frames are downscaled to this height before being encoded and
+        sent. Received keypoints are rescaled back to the original video resolution.""")
+    parser.add_argument(
+        '--encode-workers',
+        type=int,
+        required=False,
+        default=2,
+        help="""Number of background workers encoding frames before sending them.""")
+    parser.add_argument(
+        '--encode-processes',
+        action='store_true',
+        help="""Encode frames on a pool of processes instead of threads.""")
+    parser.add_argument(
+        '--lookahead',
+        type=int,
+        required=False,
+        default=8,
+        help="""Maximum number of frames of each camera decoded ahead of the requests.""")
+    parser.add_argument(
+        '--realtime',
+        action='store_true',
+        help="""Send frames no faster than the video frame rate, as if they came from live
+        cameras. The reported latency is then the delay from capture to 3D.""")
+
+    args = parser.parse_args()
+
+    main(
+        sequence_folder=args.sequence_folder,
+        info_folder=args.info_folder,
+        output_folder=args.output_folder,
+        pose_model=args.pose_model,
+        cameras=args.cameras,
+        broker_uri=args.broker_uri,
+        zipkin_uri=args.zipkin_uri,
+        min_requests=args.min_requests,
+        max_requests=args.max_requests,
+        max_localize_requests=args.max_localize_requests,
+        max_pending_samples=args.max_pending_samples,
+        detection_timeout_ms=args.detection_timeout_ms,
+        localization_timeout_ms=args.localization_timeout_ms,
+        encoder=args.encoder,
+        quality=args.quality,
+        send_height=args.send_height,
+        encode_workers=args.encode_workers,
+        encode_processes=args.encode_processes,
+        lookahead=args.lookahead,
+        realtime=args.realtime)
@@ -5,22 +5,40 @@ import pandas as pd
 from src.utils.is_msgs import data_frame_to_object_annotations
 from src.panoptic_dataset.joints import get_joint_links
 from src.utils.drawing import draw_skeletons
+from src.utils.video import SegmentedVideoReader
+from src.utils.shared_memory import SharedFrame, as_array
 
 
-def main(video_file, annotations_file, resize_factor, model):
+def read_frames(video_file):
     vc = cv2.VideoCapture(video_file)
+    frame_id = 0
+    while vc.isOpened():
+        has_frame, frame = vc.read()
+        if not has_frame:
+            break
+        yield frame_id, frame
+        frame_id += 1
+
+
+def main(video_file, annotations_file, resize_factor, model, decode_process):
+    if decode_process:
+        # frames are decoded ahead on another process, and drawn in place on shared memory
+        frames = SegmentedVideoReader(video_file, n_segments=1, n_slots=8)
+    else:
+        frames = read_frames(video_file)
     is_paused = False
 
-    frame_id = 0
     joint_links = get_joint_links(model)
 
     annotations_data = pd.read_csv(annotations_file)
 
-    while vc.isOpened():
+    while True:
         if not is_paused:
-            has_frame, frame = vc.read()
-            if not has_frame:
+            try:
+                frame_id, shared_frame = next(frames)
+            except StopIteration:
                 break
+            frame = as_array(shared_frame)
 
             frame_annotations = annotations_data[annotations_data['sample_id'] == frame_id]
             obj_annotations = data_frame_to_object_annotations(frame_annotations, model)
@@ -31,7 +49,8 @@ def main(video_file, annotations_file, resize_factor, model):
 
             cv2.imshow("Press [q] to quit and [k] to pause/resume", frame)
 
-            frame_id += 1
+            if isinstance(shared_frame, SharedFrame):
+                shared_frame.release()
 
         key = cv2.waitKey(1)
         if key == ord('q'):
@@ -39,6 +58,9 @@ def main(video_file, annotations_file, resize_factor, model):
         elif key == ord('k'):
             is_paused = ~is_paused
 
+    if decode_process:
+        frames.close()
+
 
 if __name__ == '__main__':
     parser = ArgumentParser()
@@ -69,6 +91,10 @@ if __name__ == '__main__':
         type=float,
         required=False,
         help=""""Scale factor to be applied on image before display it.""")
+    parser.add_argument(
+        '--decode-process',
+        action='store_true',
+        help="""Decode frames ahead on another process, sharing them through shared memory.""")
 
     args = parser.parse_args()
-    main(args.video, args.annotations, args.resize, args.model)
\ No newline at end of file
+    main(args.video, args.annotations, args.resize, args.model, args.decode_process)
\ No newline at end of file
@@ -2,6 +2,7 @@ import re
 import json
 from os.path import join, exists, dirname
 import numpy as np
+import pandas as pd
 
 from is_msgs.camera_pb2 import CameraCalibration
 from src.utils.numpy import to_tensor
@@ -59,6 +60,25 @@ def make_df_columns(pose_model, has_z=True):
     return columns
 
 
+def read_detections(annotations_folder_path, cameras):
+    """
+    Reads 2D annotations of each camera and returns, for each sample id, a dictionary
+    mapping cameras to (n_skeletons, n_joints, [x, y, score]) arrays.
+    """
+    samples = {}
+    for camera in cameras:
+        df = pd.read_csv(join(annotations_folder_path, '{}.csv'.format(camera)))
+        df = df.sort_values(by=['sample_id', 'person_id'], kind='mergesort')
+        sample_ids = df['sample_id'].values.astype(int)
+        data = df.drop(['sample_id', 'person_id'], axis=1).values
+        data = data.reshape(data.shape[0], -1, 3)
+
+        unique_ids, first_rows = np.unique(sample_ids, return_index=True)
+        for sample_id, rows in zip(unique_ids, np.split(data, first_rows[1:])):
+            samples.setdefault(int(sample_id), {})[camera] = rows
+    return samples
+
+
 def load_calibrations_pb(calibrations_file, referencial=9999, cameras=None):
     """
     Load Panoptic CMU dataset calibrations from HD cameras, convert in to a
@@ -0,0 +1,116 @@
+from itertools import combinations
+import numpy as np
+from src.utils.assignment import linear_sum_assignment
+from src.reconstruction.epipolar import mean_epipolar_distances
+
+ASSOCIATION_METHODS = ['greedy', 'hungarian']
+
+
+def affinity_matrices(points, valid, fundamentals):
+    """
+    Mean epipolar distance between all pairs of skeletons of each camera pair. 'points' and
+    'valid' map camera ids to (P, J, 2) undistorted joints and (P, J) valid joints. Returns
+    a dictionary from (a, b) camera pairs, with a < b, to (Pa, Pb) matrices.
+    """
+    cameras = sorted(points.keys())
+    return {(a, b): mean_epipolar_distances(fundamentals[(a, b)], points[a], valid[a],
+                                            points[b], valid[b])
+            for a, b in combinations(cameras, 2)}
+
+
+def n_computations(affinities):
+    # same measure of 'bin/metrics/grouper_duration.py', skeleton pairs over camera pairs
+    return sum(affinity.size for affinity in affinities.values())
+
+
+def _affinity(affinities, view_a, view_b):
+    (camera_a, index_a), (camera_b, index_b) = sorted([view_a, view_b])
+    return affinities[(camera_a, camera_b)][index_a, index_b]
+
+
+def candidate_pairs(affinities, max_error):
+    """
+    All pairs of skeletons, as (error, (camera a, index), (camera b, index)), with mean
+    epipolar distance below 'max_error'.
+    """
+    candidates = []
+    for (a, b), affinity in affinities.items():
+        for i, j in zip(*np.where(affinity < max_error)):
+            candidates.append((affinity[i, j], (a, i), (b, j)))
+    return candidates
+
+
+def hungarian_pairs(affinities, max_error):
+    """
+    Like 'candidate_pairs', but each skeleton is paired with at most one skeleton of each
+    other camera, through an optimal assignment on every camera pair.
+    """
+    candidates = []
+    for (a, b), affinity in affinities.items():
+        cost = np.where(affinity < max_error, affinity, np.inf)
+        rows, columns = linear_sum_assignment(cost)
+        candidates.extend((cost[i, j], (a, i), (b, j)) for i, j in zip(rows, columns))
+    return candidates
+
+
+def greedy_association(candidates):
+    """
+    Groups skeletons following 'candidates' from the lowest error, as long as a group
+    doesn't get two skeletons of the same camera. Returns a list of dictionaries mapping
+    camera ids to skeleton indexes.
+    """
+    groups = []
+    group_of = {}
+    for _, view_a, view_b in sorted(candidates, key=lambda x: x[0]):
+        group_a, group_b = group_of.get(view_a), group_of.get(view_b)
+        if group_a is not None and group_a is group_b:
+            continue
+
+        if group_a is None and group_b is None:
+            group = {view_a[0]: view_a[1], view_b[0]: view_b[1]}
+            groups.append(group)
+            group_of[view_a], group_of[view_b] = group, group
+        elif group_a is None or group_b is None:
+            group, view = (group_b, view_a) if group_a is None else (group_a, view_b)
+            if view[0] in group:
+                continue
+            group[view[0]] = view[1]
+            group_of[view] = group
+        else:
+            if len(set(group_a.keys()).intersection(group_b.keys())) > 0:
+                continue
+            group_a.update(group_b)
+            for view in group_b.items():
+                group_of[view] = group_a
+            groups = [group for group in groups if group is not group_b]
+    return groups
+
+
+def consistent_association(candidates, affinities, max_error):
+    """
+    Greedy clustering of 'candidates' with cycle consistency. Two groups are only merged
+    if every pair of skeletons across them, with joints in common, also has mean epipolar
+    distance below 'max_error', i.e. if a matches b and b matches c, a must match c.
+    """
+    groups = []
+    group_of = {}
+    for _, view_a, view_b in sorted(candidates, key=lambda x: x[0]):
+        group_a = group_of.get(view_a, {view_a[0]: view_a[1]})
+        group_b = group_of.get(view_b, {view_b[0]: view_b[1]})
+        if group_a is group_b or len(set(group_a.keys()).intersection(group_b.keys())) > 0:
+            continue
+
+        cross_errors = [
+            _affinity(affinities, cross_a, cross_b)
+            for cross_a in group_a.items() for cross_b in group_b.items()
+        ]
+        if any(np.isfinite(error) and error >= max_error for error in cross_errors):
+            continue
+
+        groups = [group for group in groups if group is not group_a and group is not group_b]
+        group = dict(group_a)
+        group.update(group_b)
+        groups.append(group)
+        for view in group.items():
+            group_of[view] = group
+    return groups
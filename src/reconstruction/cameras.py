@@ -0,0 +1,101 @@
+import json
+import re
+from os import walk
+from os.path import join
+import cv2
+import numpy as np
+from src.utils.cv import undistort_points
+
+CALIBRATION_FILE_PATTERN = re.compile(r'^([0-9]+).json$')
+
+
+def _tensor_to_np(tensor):
+    # JSON form of a 'is_msgs.common_pb2.Tensor', read without protobuf
+    shape = tuple(dim['size'] for dim in tensor['shape']['dims'])
+    for key in ['doubles', 'floats', 'ints32', 'ints64']:
+        if len(tensor.get(key, [])) > 0:
+            return np.array(tensor[key], dtype=np.float64).reshape(shape)
+    return np.zeros(shape)
+
+
+class Camera:
+    """
+    Calibration of a camera, with 'K' intrinsic matrix, 'd' distortion coefficients on
+    OpenCV 5 coefficients model, and 'RT' extrinsic matrix from world to camera coordinates.
+    """
+
+    def __init__(self, camera_id, K, d, RT, resolution):
+        self._camera_id = camera_id
+        self._K = np.asarray(K, dtype=np.float64)
+        self._d = np.asarray(d, dtype=np.float64).ravel()
+        self._RT = np.asarray(RT, dtype=np.float64)
+        self._resolution = tuple(resolution)
+        self._P = np.matmul(self._K, self._RT[0:3, :])
+
+    def camera_id(self):
+        return self._camera_id
+
+    def intrinsic(self):
+        return self._K
+
+    def distortion(self):
+        return self._d
+
+    def extrinsic(self):
+        return self._RT
+
+    def resolution(self):
+        return self._resolution
+
+    def projection(self):
+        return self._P
+
+    def undistort(self, points, iterations=None):
+        """
+        Removes distortion of an (N, 2) array of image points, keeping them on pixels. Uses
+        OpenCV, unless 'iterations' is given, when 'undistort_points' solves the points with
+        that many iterations, slower on few points but exact to far below a pixel.
+        """
+        if iterations is not None:
+            return undistort_points(points, self._K, self._d, iterations)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        if points.shape[0] == 0:
+            return points.reshape(0, 2)
+        undistorted = cv2.undistortPoints(points, self._K, self._d, P=self._K)
+        return undistorted.reshape(-1, 2)
+
+
+def load_camera(file):
+    with open(file, 'r') as f:
+        calibration = json.load(f)
+    resolution = (calibration['resolution']['width'], calibration['resolution']['height'])
+    return Camera(
+        camera_id=int(calibration['id']),
+        K=_tensor_to_np(calibration['intrinsic']),
+        d=_tensor_to_np(calibration['distortion']),
+        RT=_tensor_to_np(calibration['extrinsic'][0]['tf']),
+        resolution=resolution)
+
+
+def load_cameras(calibrations_folder, cameras=None):
+    """
+    Loads calibrations of 'cameras', or of all the ones available, from a folder with a
+    '{camera_id}.json' file for each camera, e.g. 'etc/calibrations/{sequence}/calibrations'.
+    """
+    _, _, files = next(walk(calibrations_folder))
+    available = {
+        int(CALIBRATION_FILE_PATTERN.match(file).groups()[0]): file
+        for file in files if CALIBRATION_FILE_PATTERN.match(file) is not None
+    }
+    if cameras is None:
+        cameras = sorted(available.keys())
+
+    not_available_cameras = set(cameras).difference(available.keys())
+    if len(not_available_cameras) > 0:
+        raise Exception("Calibration of camera(s) {} not available on '{}'.".format(
+            ', '.join(map(str, sorted(not_available_cameras))), calibrations_folder))
+
+    return {
+        camera_id: load_camera(join(calibrations_folder, available[camera_id]))
+        for camera_id in cameras
+    }
@@ -0,0 +1,75 @@
+from itertools import combinations
+import numpy as np
+
+
+def fundamental_matrix(camera_a, camera_b):
+    """
+    Fundamental matrix 'F' between two cameras, such that x_b^T F x_a = 0 for undistorted
+    image points of the same 3D point.
+    """
+    RT_a = camera_a.extrinsic()
+    center_a = np.append(-np.matmul(RT_a[0:3, 0:3].T, RT_a[0:3, 3]), 1.0)
+    P_a, P_b = camera_a.projection(), camera_b.projection()
+
+    epipole = np.matmul(P_b, center_a)
+    epipole_cross = np.array([
+        [0.0, -epipole[2], epipole[1]],
+        [epipole[2], 0.0, -epipole[0]],
+        [-epipole[1], epipole[0], 0.0],
+    ])
+    return np.matmul(epipole_cross, np.matmul(P_b, np.linalg.pinv(P_a)))
+
+
+class FundamentalMatrices:
+    """
+    Fundamental matrices of all pairs of 'cameras', a dictionary of calibrations of a
+    sequence, computed once. Indexing with (a, b) gives the matrix from camera 'a' to 'b'.
+    """
+
+    def __init__(self, cameras):
+        self._matrices = {}
+        for a, b in combinations(sorted(cameras.keys()), 2):
+            self._matrices[(a, b)] = fundamental_matrix(cameras[a], cameras[b])
+
+    def __len__(self):
+        return len(self._matrices)
+
+    def __getitem__(self, pair):
+        a, b = pair
+        if (a, b) in self._matrices:
+            return self._matrices[(a, b)]
+        return self._matrices[(b, a)].T
+
+
+def epipolar_distances(F, x_a, x_b):
+    """
+    Symmetric epipolar distances, in pixels, between the joints of all pairs of skeletons
+    from two cameras. 'x_a' and 'x_b' are (Pa, J, 2) and (Pb, J, 2) arrays of undistorted
+    image points, and 'F' the fundamental matrix from camera 'a' to 'b'. Returns a
+    (Pa, Pb, J) array.
+    """
+    h_a = np.concatenate([x_a, np.ones(x_a.shape[0:2] + (1, ))], axis=2)
+    h_b = np.concatenate([x_b, np.ones(x_b.shape[0:2] + (1, ))], axis=2)
+    # epipolar lines of points from 'a' on 'b', and of points from 'b' on 'a'
+    lines_b = np.matmul(h_a, F.T)
+    lines_a = np.matmul(h_b, F)
+
+    algebraic = np.abs(np.einsum('pjk,qjk->pqj', lines_b, h_b))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distance_b = algebraic / np.linalg.norm(lines_b[:, :, 0:2], axis=2)[:, np.newaxis, :]
+        distance_a = algebraic / np.linalg.norm(lines_a[:, :, 0:2], axis=2)[np.newaxis, :, :]
+    return 0.5 * (distance_a + distance_b)
+
+
+def mean_epipolar_distances(F, x_a, valid_a, x_b, valid_b):
+    """
+    Mean, over joints valid on both skeletons, of 'epipolar_distances'. 'valid_a' and
+    'valid_b' are (Pa, J) and (Pb, J) boolean arrays. Returns a (Pa, Pb) array, with
+    infinity on pairs without joints in common.
+    """
+    distances = epipolar_distances(F, x_a, x_b)
+    common = np.logical_and(valid_a[:, np.newaxis, :], valid_b[np.newaxis, :, :])
+    n_common = common.sum(axis=2)
+    mean = np.where(common, distances, 0.0).sum(axis=2) / np.maximum(n_common, 1)
+    mean[n_common == 0] = np.inf
+    return mean
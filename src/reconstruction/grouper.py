@@ -0,0 +1,158 @@
+from itertools import combinations
+import numpy as np
+from src.utils.cv import triangulate_points
+from src.reconstruction.epipolar import FundamentalMatrices
+from src.reconstruction.association import affinity_matrices, candidate_pairs, hungarian_pairs
+from src.reconstruction.association import greedy_association, consistent_association
+from src.reconstruction.association import ASSOCIATION_METHODS
+
+
+class SkeletonsGrouper:
+    """
+    Local version of the 'SkeletonsGrouper.Localize' service. Skeletons detected on
+    different cameras are associated when the mean epipolar distance of their joints is
+    below 'min_error' pixels, and joints of associated skeletons are triangulated. Groups
+    whose 3D skeletons are closer than 'max_distance' are merged. Joints with score not
+    greater than 'min_score' are ignored.
+
+    With the 'greedy' association, skeletons are grouped from the lowest error pair, like
+    the service. With 'hungarian', each camera pair is matched by an optimal assignment and
+    groups are merged only if consistent across all their cameras.
+    """
+
+    def __init__(self, cameras, min_error=50.0, max_distance=75.0, min_score=0.0,
+                 association='greedy'):
+        if association not in ASSOCIATION_METHODS:
+            raise Exception("Invalid association '{}'. Can be one of: {}".format(
+                association, ', '.join(ASSOCIATION_METHODS)))
+
+        self._cameras = cameras
+        self._association = association
+        self._min_error = min_error
+        self._max_distance = max_distance
+        self._min_score = min_score
+
+        self._fundamentals = FundamentalMatrices(cameras)
+
+    def cameras(self):
+        return self._cameras
+
+    def fundamentals(self):
+        return self._fundamentals
+
+    def group(self, detections):
+        """
+        'detections' maps camera ids to (n_skeletons, n_joints, [x, y, score]) arrays of
+        image points. Returns a (n_skeletons, n_joints, [x, y, z, score]) array of the 3D
+        skeletons, with invalid joints as (0, 0, 0, -1).
+        """
+        n_joints = next(iter(detections.values())).shape[1] if len(detections) > 0 else 0
+        points, valid = self.undistort(detections)
+        _, skeletons = self.localize(detections, points, valid)
+        if len(skeletons) == 0:
+            return np.zeros((0, n_joints, 4))
+        return np.stack(skeletons)
+
+    def group_annotations(self, annotations_list, model):
+        """
+        Same as 'group', but with the messages of the service: 'annotations_list' has the
+        'ObjectAnnotations' of each camera, with the camera id on 'frame_id', and the 3D
+        skeletons are returned as 'ObjectAnnotations' of 'model'.
+        """
+        # imported here so the grouper itself doesn't depend on protobuf
+        from src.utils.is_msgs import object_annotations_to_skeletons
+        from src.utils.is_msgs import skeletons_to_object_annotations
+
+        skeletons = self.group(object_annotations_to_skeletons(annotations_list, model))
+        return skeletons_to_object_annotations(skeletons, model)
+
+    def undistort(self, detections):
+        """
+        Undistorted image points of 'detections', as dictionaries mapping camera ids to
+        (n_skeletons, n_joints, 2) points and (n_skeletons, n_joints) valid joints masks.
+        """
+        points, valid = {}, {}
+        for camera_id, skeletons in detections.items():
+            if camera_id not in self._cameras or skeletons.shape[0] == 0:
+                continue
+            undistorted = self._cameras[camera_id].undistort(skeletons[:, :, 0:2].reshape(-1, 2))
+            points[camera_id] = undistorted.reshape(skeletons.shape[0], -1, 2)
+            valid[camera_id] = np.logical_and(~(skeletons[:, :, 0:2] == 0.0).all(axis=2),
+                                              skeletons[:, :, 2] > self._min_score)
+        return points, valid
+
+    def localize(self, detections, points, valid, affinities=None):
+        """
+        Associates, triangulates and merges the skeletons of 'detections', already
+        undistorted on 'points' and 'valid'. The 'affinity_matrices' of the camera pairs can
+        be given when already computed. Returns the groups, as dictionaries mapping camera ids
+        to skeleton indexes, and a list with the 3D skeleton of each group.
+        """
+        n_joints = next(iter(detections.values())).shape[1] if len(detections) > 0 else 0
+        if affinities is None:
+            affinities = affinity_matrices(points, valid, self._fundamentals)
+        groups = self._associate(affinities)
+        skeletons = self.triangulate(groups, detections, points, valid, n_joints)
+        return self._merge_close(groups, skeletons, detections, points, valid, n_joints)
+
+    def _associate(self, affinities):
+        if self._association == 'hungarian':
+            candidates = hungarian_pairs(affinities, self._min_error)
+            return consistent_association(candidates, affinities, self._min_error)
+        return greedy_association(candidate_pairs(affinities, self._min_error))
+
+    def triangulate(self, groups, detections, points, valid, n_joints):
+        """
+        3D skeleton, as a (n_joints, [x, y, z, score]) array, of each group of skeletons.
+        """
+        if len(groups) == 0:
+            return []
+        # joints of all groups are triangulated at once, over all cameras with observations
+        cameras = sorted(set(camera_id for group in groups for camera_id in group.keys()))
+        P = np.stack([self._cameras[camera_id].projection() for camera_id in cameras])
+        x = np.zeros((len(groups), n_joints, len(cameras), 2))
+        mask = np.zeros((len(groups), n_joints, len(cameras)), dtype=bool)
+        scores = np.zeros((len(groups), n_joints, len(cameras)))
+        for g, group in enumerate(groups):
+            for c, camera_id in enumerate(cameras):
+                if camera_id not in group:
+                    continue
+                index = group[camera_id]
+                x[g, :, c] = points[camera_id][index]
+                mask[g, :, c] = valid[camera_id][index]
+                scores[g, :, c] = detections[camera_id][index, :, 2]
+
+        X = triangulate_points(P, x.reshape(-1, len(cameras), 2), mask.reshape(-1, len(cameras)))
+        X = X.reshape(len(groups), n_joints, 3)
+        triangulated = ~np.isnan(X).any(axis=2)
+
+        skeletons = np.zeros((len(groups), n_joints, 4))
+        skeletons[:, :, 3] = -1.0
+        skeletons[triangulated, 0:3] = X[triangulated]
+        with np.errstate(invalid='ignore'):
+            mean_scores = np.sum(scores * mask, axis=2) / mask.sum(axis=2)
+        skeletons[triangulated, 3] = mean_scores[triangulated]
+        return list(skeletons)
+
+    def _merge_close(self, groups, skeletons, detections, points, valid, n_joints):
+        merged = True
+        while merged:
+            merged = False
+            for (a, group_a), (b, group_b) in combinations(enumerate(groups), 2):
+                if len(set(group_a.keys()).intersection(group_b.keys())) > 0:
+                    continue
+                common = np.logical_and(skeletons[a][:, 3] >= 0.0, skeletons[b][:, 3] >= 0.0)
+                if not common.any():
+                    continue
+                distance = np.linalg.norm(
+                    skeletons[a][common, 0:3] - skeletons[b][common, 0:3], axis=1).mean()
+                if distance < self._max_distance:
+                    group = dict(group_a)
+                    group.update(group_b)
+                    groups = [g for i, g in enumerate(groups) if i not in (a, b)] + [group]
+                    skeletons = [s for i, s in enumerate(skeletons) if i not in (a, b)]
+                    skeletons.extend(
+                        self.triangulate([group], detections, points, valid, n_joints))
+                    merged = True
+                    break
+        return groups, skeletons
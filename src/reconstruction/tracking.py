@@ -0,0 +1,175 @@
+import numpy as np
+from src.utils.assignment import linear_sum_assignment
+
+
+def reprojection_distances(P, skeletons, points, valid):
+    """
+    Mean distance, in pixels, between the (T, J, [x, y, z, score]) 3D 'skeletons' projected
+    by 'P' and the (D, J, 2) undistorted image 'points' with (D, J) 'valid' joints. Returns
+    a (T, D) matrix, with inf where they have no joints in common.
+    """
+    X = np.concatenate([skeletons[:, :, 0:3], np.ones(skeletons.shape[0:2] + (1, ))], axis=2)
+    x = np.matmul(X, P.T)
+    in_front = np.logical_and(skeletons[:, :, 3] >= 0.0, x[:, :, 2] > 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = x[:, :, 0:2] / x[:, :, 2:3]
+
+    common = np.logical_and(in_front[:, np.newaxis], valid[np.newaxis])
+    distances = np.linalg.norm(x[:, np.newaxis] - points[np.newaxis], axis=3)
+    n_common = common.sum(axis=2)
+    with np.errstate(invalid='ignore'):
+        mean = np.where(common, distances, 0.0).sum(axis=2) / n_common
+    return np.where(n_common > 0, mean, np.inf)
+
+
+def mean_distance(skeleton_a, skeleton_b):
+    """
+    Mean distance between the joints localized on both (J, [x, y, z, score]) skeletons, or
+    inf if they have no joints in common.
+    """
+    common = np.logical_and(skeleton_a[:, 3] >= 0.0, skeleton_b[:, 3] >= 0.0)
+    if not common.any():
+        return np.inf
+    return np.linalg.norm(skeleton_a[common, 0:3] - skeleton_b[common, 0:3], axis=1).mean()
+
+
+class SkeletonsTracker:
+    """
+    Keeps the 3D skeletons of the previous samples with stable person ids. On each sample,
+    tracked skeletons are projected on every camera and matched to the new detections whose
+    mean reprojection distance is below 'max_error' pixels. Only the detections left
+    unmatched go through the full association of 'grouper', and the skeletons they give
+    are joined to a tracked one, or resume a lost track, when closer than 'max_distance'.
+    Tracks not seen for more than 'max_missed' samples are dropped.
+    """
+
+    def __init__(self, grouper, max_error=50.0, max_distance=75.0, max_missed=5):
+        self._grouper = grouper
+        self._max_error = max_error
+        self._max_distance = max_distance
+        self._max_missed = max_missed
+
+        self._next_id = 0
+        self._tracks = {}
+        self._missed = {}
+        self._n_samples = 0
+        self._n_tracked = 0
+        self._n_associated = 0
+
+    def n_tracks(self):
+        return self._next_id
+
+    def stats(self):
+        n_detections = self._n_tracked + self._n_associated
+        return {
+            'samples': self._n_samples,
+            'tracked_detections': self._n_tracked,
+            'associated_detections': self._n_associated,
+            'tracked_ratio': self._n_tracked / n_detections if n_detections > 0 else 0.0,
+        }
+
+    def track(self, detections):
+        """
+        'detections' maps camera ids to (n_skeletons, n_joints, [x, y, score]) arrays of
+        image points. Returns a (n_skeletons, n_joints, [x, y, z, score]) array of the 3D
+        skeletons, with invalid joints as (0, 0, 0, -1), and an array with their person ids.
+        """
+        n_joints = next(iter(detections.values())).shape[1] if len(detections) > 0 else 0
+        points, valid = self._grouper.undistort(detections)
+        track_ids, groups = self._pre_assign(points, valid)
+
+        skeletons = self._grouper.triangulate(groups, detections, points, valid, n_joints)
+        person_ids = list(track_ids)
+        for group in groups:
+            self._n_tracked += len(group)
+
+        # detections not explained by any track are associated from scratch
+        remaining = {}
+        for camera_id in points.keys():
+            free = np.ones(points[camera_id].shape[0], dtype=bool)
+            free[[group[camera_id] for group in groups if camera_id in group]] = False
+            if free.any():
+                remaining[camera_id] = np.where(free)[0]
+        if len(remaining) > 0:
+            new_groups, new_skeletons = self._grouper.localize(
+                {camera_id: detections[camera_id][indexes]
+                 for camera_id, indexes in remaining.items()},
+                {camera_id: points[camera_id][indexes]
+                 for camera_id, indexes in remaining.items()},
+                {camera_id: valid[camera_id][indexes]
+                 for camera_id, indexes in remaining.items()})
+            for group, skeleton in zip(new_groups, new_skeletons):
+                self._n_associated += len(group)
+                group = {camera_id: remaining[camera_id][i] for camera_id, i in group.items()}
+
+                # the same person of a tracked skeleton, seen only on other cameras
+                distances = [
+                    mean_distance(skeleton, other) if len(set(group).intersection(tracked)) == 0
+                    else np.inf for tracked, other in zip(groups, skeletons)
+                ]
+                if len(distances) > 0 and min(distances) < self._max_distance:
+                    closest = int(np.argmin(distances))
+                    groups[closest].update(group)
+                    skeletons[closest] = self._grouper.triangulate([groups[closest]], detections,
+                                                                   points, valid, n_joints)[0]
+                    continue
+
+                # or a track lost on previous samples
+                lost = [track_id for track_id in self._tracks.keys() if track_id not in person_ids]
+                distances = [mean_distance(skeleton, self._tracks[track_id]) for track_id in lost]
+                if len(distances) > 0 and min(distances) < self._max_distance:
+                    person_ids.append(lost[int(np.argmin(distances))])
+                else:
+                    person_ids.append(self._next_id)
+                    self._next_id += 1
+                groups.append(group)
+                skeletons.append(skeleton)
+
+        self._update(person_ids, skeletons)
+        self._n_samples += 1
+
+        localized = [i for i, skeleton in enumerate(skeletons) if (skeleton[:, 3] >= 0.0).any()]
+        if len(localized) == 0:
+            return np.zeros((0, n_joints, 4)), np.zeros(0, dtype=int)
+        return np.stack([skeletons[i] for i in localized]), np.array(person_ids)[localized]
+
+    def _pre_assign(self, points, valid):
+        # each track takes at most one detection per camera, by an optimal assignment
+        if len(self._tracks) == 0:
+            return [], []
+
+        track_ids = sorted(self._tracks.keys())
+        tracked = np.stack([self._tracks[track_id] for track_id in track_ids])
+        assigned = [{} for _ in track_ids]
+        cameras = self._grouper.cameras()
+        for camera_id in points.keys():
+            distances = reprojection_distances(cameras[camera_id].projection(), tracked,
+                                               points[camera_id], valid[camera_id])
+            cost = np.where(distances < self._max_error, distances, np.inf)
+            for t, d in zip(*linear_sum_assignment(cost)):
+                assigned[t][camera_id] = d
+
+        # at least two views are needed to triangulate, single views are associated again
+        matched = [(track_id, group) for track_id, group in zip(track_ids, assigned)
+                   if len(group) > 1]
+        return [track_id for track_id, _ in matched], [group for _, group in matched]
+
+    def _update(self, person_ids, skeletons):
+        seen = set()
+        for person_id, skeleton in zip(person_ids, skeletons):
+            localized = skeleton[:, 3] >= 0.0
+            if not localized.any():
+                continue
+            # joints not localized now keep their last position to be projected later
+            tracked = self._tracks.get(person_id, skeleton)
+            self._tracks[person_id] = np.where(localized[:, np.newaxis], skeleton, tracked)
+            self._missed[person_id] = 0
+            seen.add(person_id)
+
+        for track_id in list(self._tracks.keys()):
+            if track_id in seen:
+                continue
+            self._missed[track_id] += 1
+            if self._missed[track_id] > self._max_missed:
+                del self._tracks[track_id]
+                del self._missed[track_id]
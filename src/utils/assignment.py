@@ -0,0 +1,82 @@
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment as _scipy_linear_sum_assignment
+except ImportError:
+    _scipy_linear_sum_assignment = None
+
+
+def _hungarian(cost):
+    # O(n^2 m) Hungarian algorithm with potentials, for n <= m, rows and columns from 1
+    n, m = cost.shape
+    u, v = np.zeros(n + 1), np.zeros(m + 1)
+    assigned_row = np.zeros(m + 1, dtype=int)
+    way = np.zeros(m + 1, dtype=int)
+
+    for row in range(1, n + 1):
+        assigned_row[0] = row
+        column = 0
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current_row = assigned_row[column]
+            free = ~used[1:]
+            slack = cost[current_row - 1] - u[current_row] - v[1:]
+            improved = np.logical_and(free, slack < min_slack[1:])
+            min_slack[1:][improved] = slack[improved]
+            way[1:][improved] = column
+
+            candidates = np.where(free, min_slack[1:], np.inf)
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+
+            used_columns = np.where(used)[0]
+            u[assigned_row[used_columns]] += delta
+            v[used_columns] -= delta
+            min_slack[1:][free] -= delta
+
+            column = next_column
+            if assigned_row[column] == 0:
+                break
+
+        while column != 0:
+            previous = way[column]
+            assigned_row[column] = assigned_row[previous]
+            column = previous
+
+    columns = np.where(assigned_row[1:] > 0)[0]
+    rows = assigned_row[1:][columns] - 1
+    order = np.argsort(rows)
+    return rows[order], columns[order]
+
+
+def linear_sum_assignment(cost, use_scipy=True):
+    """
+    Assignment of rows to columns of a rectangular 'cost' matrix with minimum total cost,
+    returned as (rows, columns) index arrays, like 'scipy.optimize.linear_sum_assignment'.
+    Infinite costs are forbidden pairs and are left out of the result. Uses SciPy when
+    installed, otherwise a built-in Hungarian algorithm.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.size == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    finite = np.isfinite(cost)
+    if not finite.any():
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    # forbidden pairs cost more than any assignment made only of allowed pairs
+    forbidden_cost = 1.0 + min(cost.shape) * (np.abs(cost[finite]).max() + 1.0)
+    bounded = np.where(finite, cost, forbidden_cost)
+
+    if use_scipy and _scipy_linear_sum_assignment is not None:
+        rows, columns = _scipy_linear_sum_assignment(bounded)
+    elif bounded.shape[0] <= bounded.shape[1]:
+        rows, columns = _hungarian(bounded)
+    else:
+        columns, rows = _hungarian(bounded.T)
+        order = np.argsort(rows)
+        rows, columns = rows[order], columns[order]
+
+    allowed = finite[rows, columns]
+    return rows[allowed], columns[allowed]
@@ -0,0 +1,115 @@
+import json
+import time
+import sqlite3
+import hashlib
+
+
+def config_hash(config_file=None, **options):
+    """
+    Hash identifying a detector configuration, made from the content of its configuration
+    file, if any, and from other options that change detections, e.g. encoding options.
+    """
+    sha1 = hashlib.sha1()
+    if config_file is not None:
+        with open(config_file, 'rb') as f:
+            sha1.update(f.read())
+    sha1.update(json.dumps(options, sort_keys=True).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+class DetectionCache:
+    """
+    Local cache, on a SQLite file, of serialized detections keyed by sequence, camera,
+    sample id and detector configuration hash. When the cache gets bigger than 'max_size'
+    bytes, least recently used entries are evicted.
+    """
+
+    def __init__(self, file_path, max_size, commit_every=100):
+        self._db = sqlite3.connect(file_path)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS detections (
+                sequence TEXT, camera INTEGER, sample_id INTEGER, config TEXT,
+                data BLOB, size INTEGER, accessed REAL,
+                PRIMARY KEY (sequence, camera, sample_id, config))""")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS detections_accessed ON detections (accessed)")
+        self._max_size = max_size
+        self._commit_every = commit_every
+        self._n_uncommitted = 0
+
+        self._size = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM detections").fetchone()[0]
+        self._hits, self._misses, self._evictions = 0, 0, 0
+
+    def cached_detections(self, sequence, camera, config, iter_range, skip=None):
+        """
+        (sample_id, data) pairs, sorted by sample id, of all detections cached for a camera
+        with ids on 'iter_range' and not on 'skip'. They're all read at once, so entries
+        evicted later by 'put' are still served.
+        """
+        key = (sequence, camera, config, iter_range.start, iter_range.stop - 1)
+        rows = self._db.execute(
+            "SELECT sample_id, data FROM detections WHERE sequence=? AND camera=? AND config=? "
+            "AND sample_id BETWEEN ? AND ? ORDER BY sample_id", key).fetchall()
+        detections = [(sample_id, bytes(data)) for sample_id, data in rows
+                      if skip is None or sample_id not in skip]
+
+        self._db.execute(
+            "UPDATE detections SET accessed=? WHERE sequence=? AND camera=? AND config=? "
+            "AND sample_id BETWEEN ? AND ?", (time.time(), ) + key)
+        self._uncommitted()
+        self._hits += len(detections)
+        return detections
+
+    def count_miss(self):
+        # samples not found by 'cached_detections', i.e. sent to the detector
+        self._misses += 1
+
+    def put(self, sequence, camera, sample_id, config, data):
+        key = (sequence, camera, sample_id, config)
+        row = self._db.execute(
+            "SELECT size FROM detections WHERE sequence=? AND camera=? AND sample_id=? "
+            "AND config=?", key).fetchone()
+        if row is not None:
+            self._size -= row[0]
+
+        self._db.execute("INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         key + (sqlite3.Binary(data), len(data), time.time()))
+        self._size += len(data)
+        if self._size > self._max_size:
+            self._evict()
+        self._uncommitted()
+
+    def stats(self):
+        n_lookups = self._hits + self._misses
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_ratio': self._hits / n_lookups if n_lookups > 0 else 0.0,
+            'evictions': self._evictions,
+            'size_mb': self._size / 2**20,
+        }
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+    def _uncommitted(self):
+        self._n_uncommitted += 1
+        if self._n_uncommitted >= self._commit_every:
+            self._db.commit()
+            self._n_uncommitted = 0
+
+    def _evict(self):
+        # leave some room to not evict on every insertion
+        target_size = 0.9 * self._max_size
+        rows = self._db.execute(
+            "SELECT rowid, size FROM detections ORDER BY accessed").fetchall()
+        evicted = []
+        for rowid, size in rows:
+            if self._size <= target_size:
+                break
+            evicted.append((rowid, ))
+            self._size -= size
+        self._db.executemany("DELETE FROM detections WHERE rowid=?", evicted)
+        self._evictions += len(evicted)
@@ -29,7 +29,90 @@ def to_camera(X, K, RT, d=None, ret_homogeneous=False):
         return x[0:2, :]
 
 
+def undistort_points(x, K, d, iterations=5):
+    """
+    Inverse of the distortion applied by 'to_camera', for a (N, 2) array of image points.
+    Each point is solved by a fixed number of Newton iterations, all points at once.
+    Returns the (N, 2) undistorted points, on pixels.
+    """
+    x = np.asarray(x, dtype=np.float64).reshape(-1, 2)
+    K, d = np.asarray(K, dtype=np.float64), np.asarray(d, dtype=np.float64).ravel()
+    k1, k2, p1, p2, k3 = d[0], d[1], d[2], d[3], d[4]
+
+    # normalized distorted coordinates, also the first guess of the undistorted ones
+    y = (x[:, 1] - K[1, 2]) / K[1, 1]
+    x_ = (x[:, 0] - K[0, 2] - K[0, 1] * y) / K[0, 0]
+    u, v = x_.copy(), y.copy()
+    for _ in range(iterations):
+        r2 = u * u + v * v
+        radial_factor = 1 + k1 * r2 + k2 * (r2**2) + k3 * (r2**3)
+        radial_derivative = 2 * (k1 + 2 * k2 * r2 + 3 * k3 * (r2**2))
+        error_u = u * radial_factor + 2 * p1 * u * v + p2 * (r2 + 2 * u * u) - x_
+        error_v = v * radial_factor + p1 * (r2 + 2 * v * v) + 2 * p2 * u * v - y
+
+        du_du = radial_factor + radial_derivative * u * u + 2 * p1 * v + 6 * p2 * u
+        du_dv = radial_derivative * u * v + 2 * p1 * u + 2 * p2 * v
+        dv_dv = radial_factor + radial_derivative * v * v + 6 * p1 * v + 2 * p2 * u
+        determinant = du_du * dv_dv - du_dv * du_dv
+        u = u - (dv_dv * error_u - du_dv * error_v) / determinant
+        v = v - (du_du * error_v - du_dv * error_u) / determinant
+
+    return np.stack([K[0, 0] * u + K[0, 1] * v + K[0, 2], K[1, 1] * v + K[1, 2]], axis=1)
+
+
 def validate_resolution(joints, width, height):
     if joints.shape[0] != 2:
         raise Exception("'joints' array first shape must be equals 2.")
     return np.logical_not(np.logical_or(joints[0, :] > width, joints[1, :] > height))
+
+
+def projection_matrices(K, RT):
+    """
+    Stacks projection matrices K[R|t] of C cameras, from (C, 3, 3) intrinsic and (C, 4, 4)
+    or (C, 3, 4) extrinsic matrices, into a (C, 3, 4) array.
+    """
+    K, RT = np.asarray(K, dtype=np.float64), np.asarray(RT, dtype=np.float64)
+    return np.matmul(K, RT[:, 0:3, :])
+
+
+def triangulate_points(P, x, mask=None, weights=None, ret_error=False):
+    """
+    Triangulates, by DLT, N points observed on C cameras with (C, 3, 4) projection matrices
+    'P'. 'x' is an (N, C, 2) array of undistorted image points, 'mask' an (N, C) array with
+    valid observations and 'weights' an (N, C) array, e.g. keypoint scores, weighting each
+    observation. All N systems are solved with a single batched SVD. Returns an (N, 3) array,
+    with NaN on points observed by less than two cameras, and, if 'ret_error', the mean
+    reprojection error of each point on its valid observations.
+    """
+    P = np.asarray(P, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    n_points, n_cameras = x.shape[0:2]
+    if mask is None:
+        mask = np.ones((n_points, n_cameras), dtype=bool)
+    # masked observations can be NaN, which would make the SVD of their whole system fail
+    x = np.where(mask[:, :, np.newaxis], x, 0.0)
+    row_weights = mask.astype(np.float64)
+    if weights is not None:
+        row_weights = np.where(mask, row_weights * weights, 0.0)
+
+    # two equations per camera, x * P[2] - P[0] and y * P[2] - P[1]
+    A = x[:, :, :, np.newaxis] * P[np.newaxis, :, 2:3, :] - P[np.newaxis, :, 0:2, :]
+    A = A * row_weights[:, :, np.newaxis, np.newaxis]
+    A = A.reshape(n_points, 2 * n_cameras, 4)
+
+    X = np.linalg.svd(A)[2][:, -1, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        X = X[:, 0:3] / X[:, 3:4]
+    X[mask.sum(axis=1) < 2] = np.nan
+
+    if not ret_error:
+        return X
+
+    X_h = np.hstack([X, np.ones((n_points, 1))])
+    projected = np.einsum('cij,nj->nci', P, X_h)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        projected = projected[:, :, 0:2] / projected[:, :, 2:3]
+        errors = np.linalg.norm(projected - x, axis=2)
+        error = np.sum(np.where(mask, errors, 0.0), axis=1) / mask.sum(axis=1)
+    error[mask.sum(axis=1) < 2] = np.nan
+    return X, error
@@ -0,0 +1,124 @@
+import time
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from src.utils.shared_memory import SharedFrame, as_array
+
+try:
+    from turbojpeg import TurboJPEG
+except ImportError:
+    TurboJPEG = None
+
+ENCODER_BACKENDS = ['opencv', 'turbojpeg', 'png', 'raw']
+# raw bytes carry no image shape, so the detector can't decode them
+IMAGE_ENCODER_BACKENDS = ['opencv', 'turbojpeg', 'png']
+
+# TurboJPEG handles can't be pickled, so one is created on each process when needed
+_turbo_jpeg = None
+
+
+def _get_turbo_jpeg():
+    global _turbo_jpeg
+    if _turbo_jpeg is None:
+        _turbo_jpeg = TurboJPEG()
+    return _turbo_jpeg
+
+
+def scaled_resolution(resolution, height):
+    """
+    Resolution, as (width, height), of an image with 'resolution' resized to 'height'
+    keeping its aspect ratio. Images are never upscaled.
+    """
+    width, original_height = resolution
+    if height is None or height <= 0 or height >= original_height:
+        return (width, original_height)
+    return (int(round(width * height / original_height)), height)
+
+
+def is_available(backend):
+    if backend == 'turbojpeg':
+        return TurboJPEG is not None
+    return backend in ENCODER_BACKENDS
+
+
+class Encoder:
+    """
+    Picklable image encoder. 'quality' goes from 0.0 to 1.0 and is mapped to the JPEG
+    quality, or to the PNG compression level. The 'raw' backend just copies the image bytes.
+    If 'height' is given, images are downscaled to it before encoding.
+    """
+
+    def __init__(self, backend='opencv', quality=0.8, height=None):
+        if backend not in ENCODER_BACKENDS:
+            raise Exception("Invalid encoder backend '{}'. Can be one of: {}".format(
+                backend, ', '.join(ENCODER_BACKENDS)))
+        if not is_available(backend):
+            raise Exception("Encoder backend '{}' isn't available. Install PyTurboJPEG to use "
+                            "libjpeg-turbo.".format(backend))
+
+        self._backend = backend
+        self._quality = quality
+        self._height = height
+
+    def backend(self):
+        return self._backend
+
+    def __call__(self, image):
+        image = self.resize(as_array(image))
+        if self._backend == 'opencv':
+            params = [cv2.IMWRITE_JPEG_QUALITY, int(self._quality * (100 - 0) + 0)]
+            return cv2.imencode(ext='.jpeg', img=image, params=params)[1].tobytes()
+        elif self._backend == 'turbojpeg':
+            return _get_turbo_jpeg().encode(image, quality=int(self._quality * 100))
+        elif self._backend == 'png':
+            params = [cv2.IMWRITE_PNG_COMPRESSION, int(self._quality * (9 - 0) + 0)]
+            return cv2.imencode(ext='.png', img=image, params=params)[1].tobytes()
+        else:
+            return np.ascontiguousarray(image).tobytes()
+
+    def resize(self, image):
+        resolution = (image.shape[1], image.shape[0])
+        new_resolution = scaled_resolution(resolution, self._height)
+        if new_resolution == resolution:
+            return image
+        return cv2.resize(image, new_resolution, interpolation=cv2.INTER_AREA)
+
+
+def _timed_encode(encoder, image):
+    started_at = time.time()
+    data = encoder(image)
+    return data, time.time() - started_at
+
+
+class EncodingPool:
+    """
+    Encodes images with 'encoder' on a pool of threads or, if 'processes' is set, on a pool
+    of processes. 'submit' returns a future of (encoded bytes, encoding time) pairs.
+    Images given as a 'SharedFrame' aren't copied to the workers, and their slots are
+    released once encoded.
+    """
+
+    def __init__(self, encoder, workers=2, processes=False):
+        self._encoder = encoder
+        self._workers = max(workers, 1)
+        self._processes = processes
+        executor_type = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        self._executor = executor_type(max_workers=self._workers)
+
+    def workers(self):
+        return self._workers
+
+    def encoder(self):
+        return self._encoder
+
+    def processes(self):
+        return self._processes
+
+    def submit(self, image):
+        future = self._executor.submit(_timed_encode, self._encoder, image)
+        if isinstance(image, SharedFrame):
+            future.add_done_callback(lambda _: image.release())
+        return future
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
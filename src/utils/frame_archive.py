@@ -0,0 +1,125 @@
+import re
+import json
+import mmap
+import struct
+import time
+import numpy as np
+
+MAGIC = b'SKFA'
+VERSION = 1
+# magic, version, number of frames, offset of index table, size of metadata
+HEADER = struct.Struct('<4sIQQQ')
+INDEX_DTYPE = np.dtype([('sample_id', '<i8'), ('offset', '<u8'), ('length', '<u8')])
+ARCHIVE_FILE_PATTERN = re.compile(r'^([0-9]+).frames$')
+
+
+def is_archive_file(file):
+    return ARCHIVE_FILE_PATTERN.match(file) is not None
+
+
+def get_archive_camera_id(file):
+    match = ARCHIVE_FILE_PATTERN.match(file)
+    return -1 if match is None else int(match.groups()[0])
+
+
+def archive_file_name(camera_id):
+    return '{}.frames'.format(camera_id)
+
+
+class FrameArchiveWriter:
+    """
+    Writes encoded frames to a single file, made of a header, a JSON metadata, the
+    frames blob and, at the end, an index table with offset and size of each frame.
+    """
+
+    def __init__(self, file_path, metadata=None):
+        self._file_path = file_path
+        self._metadata = json.dumps(metadata or {}).encode('utf-8')
+        self._entries = []
+
+        self._file = open(file_path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, 0, 0, len(self._metadata)))
+        self._file.write(self._metadata)
+        self._offset = self._file.tell()
+
+    def write(self, sample_id, data):
+        self._file.write(data)
+        self._entries.append((sample_id, self._offset, len(data)))
+        self._offset += len(data)
+
+    def close(self):
+        index = np.array(self._entries, dtype=INDEX_DTYPE)
+        index.sort(order='sample_id')
+        self._file.write(index.tobytes())
+        self._file.seek(0)
+        header = HEADER.pack(MAGIC, VERSION, index.size, self._offset, len(self._metadata))
+        self._file.write(header)
+        self._file.close()
+
+
+class FrameArchive:
+    """
+    Random access, through 'mmap', to frames of a file written by 'FrameArchiveWriter'.
+    """
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._file = open(file_path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n_frames, index_offset, metadata_size = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise Exception("'{}' isn't a valid frame archive.".format(file_path))
+
+        self._metadata = json.loads(self._mm[HEADER.size:HEADER.size + metadata_size].decode())
+        self._index = np.frombuffer(
+            self._mm, dtype=INDEX_DTYPE, count=n_frames, offset=index_offset)
+        self._sample_ids = self._index['sample_id']
+
+    def metadata(self):
+        return self._metadata
+
+    def sample_ids(self):
+        return self._sample_ids
+
+    def __len__(self):
+        return self._index.size
+
+    def __getitem__(self, sample_id):
+        position = np.searchsorted(self._sample_ids, sample_id)
+        if position >= self._sample_ids.size or self._sample_ids[position] != sample_id:
+            raise KeyError(sample_id)
+        _, offset, length = self._index[position]
+        return self._mm[offset:offset + length]
+
+    def in_range(self, iter_range):
+        return ArchiveIterator(self, iter_range)
+
+    def close(self):
+        self._index, self._sample_ids = None, None
+        self._mm.close()
+        self._file.close()
+
+
+class ArchiveIterator:
+    def __init__(self, archive, iter_range):
+        self._archive = archive
+        sample_ids = archive.sample_ids()
+        in_range = np.logical_and(sample_ids >= iter_range.start, sample_ids < iter_range.stop)
+        self._sample_ids = iter(sample_ids[in_range].tolist())
+        self._n_frames = 0
+        self._read_time = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        sample_id = next(self._sample_ids)
+        started_at = time.time()
+        data = self._archive[sample_id]
+        self._read_time += time.time() - started_at
+        self._n_frames += 1
+        return sample_id, data
+
+    def stats(self):
+        return {'read_fps': self._n_frames / self._read_time if self._read_time > 0.0 else 0.0}
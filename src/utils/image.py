@@ -1,18 +1,17 @@
-import cv2
 import numpy as np
 from is_msgs.image_pb2 import Image
+from src.utils.encoding import Encoder
 
 
 def get_pb_image(input_image, encode_format='.jpeg', compression_level=0.8):
     if isinstance(input_image, np.ndarray):
         if encode_format == '.jpeg':
-            params = [cv2.IMWRITE_JPEG_QUALITY, int(compression_level * (100 - 0) + 0)]
+            encoder = Encoder(backend='opencv', quality=compression_level)
         elif encode_format == '.png':
-            params = [cv2.IMWRITE_PNG_COMPRESSION, int(compression_level * (9 - 0) + 0)]
+            encoder = Encoder(backend='png', quality=compression_level)
         else:
             return Image()
-        cimage = cv2.imencode(ext=encode_format, img=input_image, params=params)
-        return Image(data=cimage[1].tobytes())
+        return Image(data=encoder(input_image))
     elif isinstance(input_image, Image):
         return input_image
     else:
@@ -61,6 +61,19 @@ def data_frame_to_object_annotations(annotations, model, has_z=False, frame_id=0
     return annotations_pb
 
 
+def scale_object_annotations(annotations_pb, fx, fy):
+    """
+    Scales, in place, the image coordinates of all keypoints by 'fx' and 'fy'.
+    """
+    for skeleton in annotations_pb.objects:
+        for keypoint in skeleton.keypoints:
+            keypoint.position.x *= fx
+            keypoint.position.y *= fy
+    annotations_pb.resolution.width = int(round(annotations_pb.resolution.width * fx))
+    annotations_pb.resolution.height = int(round(annotations_pb.resolution.height * fy))
+    return annotations_pb
+
+
 def object_annotations_to_np(annotations_pb,
                              model,
                              has_z=False,
@@ -97,3 +110,43 @@ def object_annotations_to_np(annotations_pb,
             annotations[row, 0] = skeleton.id
 
     return annotations
+
+
+def object_annotations_to_skeletons(annotations_list, model):
+    """
+    Maps the 'frame_id' of each 'ObjectAnnotations' from 'annotations_list' to a
+    (n_skeletons, n_joints, [x, y, score]) array, the input of a local 'SkeletonsGrouper'.
+    Annotations without any skeleton are left out.
+    """
+    skeletons = {}
+    for annotations_pb in annotations_list:
+        if len(annotations_pb.objects) == 0:
+            continue
+        data = object_annotations_to_np(annotations_pb, model=model, has_z=False)
+        skeletons[annotations_pb.frame_id] = data.reshape(data.shape[0], -1, 3)
+    return skeletons
+
+
+def skeletons_to_object_annotations(skeletons, model, frame_id=0):
+    """
+    Converts a (n_skeletons, n_joints, [x, y, z, score]) array of 3D skeletons, with invalid
+    joints having negative score, to 'ObjectAnnotations' as replied by 'SkeletonsGrouper'.
+    """
+    is_valid_model(model)
+
+    annotations_pb = ObjectAnnotations()
+    annotations_pb.frame_id = frame_id
+    for person_id, skeleton_data in enumerate(skeletons):
+        skeleton = annotations_pb.objects.add()
+        skeleton.id = person_id
+        for joint_id, (x, y, z, c) in enumerate(skeleton_data):
+            human_keypoint = index_to_human_keypoint(joint_id, model)
+            if c < 0.0 or human_keypoint == HKP.Value('UNKNOWN_HUMAN_KEYPOINT'):
+                continue
+            keypoint = skeleton.keypoints.add()
+            keypoint.position.x = x
+            keypoint.position.y = y
+            keypoint.position.z = z
+            keypoint.score = c
+            keypoint.id = human_keypoint
+    return annotations_pb
@@ -33,6 +33,15 @@ class RequestManager:
         self._can_request = True
 
         self._requests = {}
+        self._handlers = {}
+
+    def add_reply_handler(self, topic, handler):
+        """
+        Register a 'handler(msg, metadata)' callable to be invoked as soon as a reply to a
+        request made on 'topic' is consumed. Replies handled this way are not returned
+        by 'consume_ready'.
+        """
+        self._handlers[topic] = handler
 
     def can_request(self):
         return self._can_request
@@ -80,14 +89,18 @@ class RequestManager:
                 if msg.status.ok() and msg.has_correlation_id():
                     cid = msg.correlation_id
                     if cid in self._requests:
-                        received_msgs.append((msg, self._requests[cid]["metadata"]))
-                        del self._requests[cid]
+                        request = self._requests.pop(cid)
+                        handler = self._handlers.get(request["msg"].topic)
+                        if handler is not None:
+                            handler(msg, request["metadata"])
+                        else:
+                            received_msgs.append((msg, request["metadata"]))
 
         except socket.timeout:
             pass
 
         # check for timeouted requests
-        for cid in self._requests.keys():
+        for cid in list(self._requests.keys()):
             timeouted_msg = self._requests[cid]["msg"]
 
             if timeouted_msg.deadline_exceeded():
@@ -2,6 +2,7 @@ import numpy as np
 import pandas as pd
 from itertools import combinations, permutations, product
 from src.panoptic_dataset.utils import is_valid_model
+from src.utils.assignment import linear_sum_assignment
 
 
 def shape_data(data):
@@ -34,6 +35,92 @@ def error_per_joint(gt_data, exp_data, pose_model):
     return compute_error_per_joint(gt_data, exp_data)
 
 
+def shape_2d_data(data):
+    # (n_skeletons, n_joints, [x, y, c])
+    return data[:, 2:].reshape(data.shape[0], -1, 3)
+
+
+def valid_2d_joints(data):
+    return np.logical_and(~(data[:, :, 0:2] == 0.0).all(axis=2), data[:, :, 2] >= 0.0)
+
+
+def match_2d_skeletons(reference, detections):
+    """
+    Greedily matches skeletons from two 2D detections arrays, with 'sample_id' and
+    'person_id' on the first columns, using the mean distance between joints valid on both
+    of them. Returns a list of (row on 'reference', row on 'detections') pairs, and the
+    distance per joint of each pair, with NaN on joints not valid on both skeletons.
+    """
+    ref, det = shape_2d_data(reference), shape_2d_data(detections)
+    distances = np.linalg.norm(ref[:, np.newaxis, :, 0:2] - det[np.newaxis, :, :, 0:2], axis=3)
+    valid = np.logical_and(valid_2d_joints(ref)[:, np.newaxis], valid_2d_joints(det)[np.newaxis])
+    distances[~valid] = np.nan
+
+    with np.errstate(invalid='ignore'):
+        n_valid = valid.sum(axis=2)
+        cost = np.where(n_valid > 0, np.nansum(distances, axis=2) / np.maximum(n_valid, 1),
+                        np.inf)
+
+    pairs = []
+    while np.isfinite(cost).any():
+        r, d = np.unravel_index(np.argmin(cost), cost.shape)
+        pairs.append((r, d))
+        cost[r, :] = np.inf
+        cost[:, d] = np.inf
+    return pairs, [distances[r, d] for r, d in pairs]
+
+
+def split_by_sample(data, sample_ids):
+    """
+    Rows of the annotations DataFrame 'data' of each one of 'sample_ids', sorting it only
+    once. Returns a list with an array for each sample, empty if it has no rows, keeping
+    the order of the rows of a sample in 'data'.
+    """
+    values = data.sort_values(by='sample_id', kind='mergesort').values
+    begins = np.searchsorted(values[:, 0], sample_ids, side='left')
+    ends = np.searchsorted(values[:, 0], sample_ids, side='right')
+    return [values[begin:end] for begin, end in zip(begins, ends)]
+
+
+def errors_per_joint(gt_data, exp_data):
+    """
+    Error of each joint between every pair of ground truth and experiment skeletons, in one
+    pass. 'gt_data' and 'exp_data' are arrays or DataFrames with a row per skeleton, like
+    the annotations files, with 'sample_id' and 'person_id' followed by 'x', 'y', 'z' and
+    'c' of each joint. Rows may span many samples, then only pairs of the same sample get
+    errors. Returns a (n_gt, n_exp, n_joints) array, with NaN for invalid joints.
+    """
+    if type(gt_data) in [pd.DataFrame, pd.Series]:
+        gt_data = gt_data.values
+    if type(exp_data) in [pd.DataFrame, pd.Series]:
+        exp_data = exp_data.values
+
+    gt = np.atleast_2d(np.asarray(gt_data, dtype=np.float64))
+    exp = np.atleast_2d(np.asarray(exp_data, dtype=np.float64))
+    gt_joints = gt[:, 2:].reshape(gt.shape[0], (gt.shape[1] - 2) // 4, 4)
+    exp_joints = exp[:, 2:].reshape(exp.shape[0], (exp.shape[1] - 2) // 4, 4)
+
+    def invalid(joints):
+        return np.logical_or((joints[:, :, 0:3] == 0.0).all(axis=2), joints[:, :, 3] < 0)
+
+    differences = gt_joints[:, np.newaxis, :, 0:3] - exp_joints[np.newaxis, :, :, 0:3]
+    errors = np.sqrt(np.sum(np.power(differences, 2), axis=3))
+    invalid_error = np.logical_or(invalid(gt_joints)[:, np.newaxis], invalid(exp_joints))
+    other_sample = gt[:, np.newaxis, 0] != exp[np.newaxis, :, 0]
+    errors[np.logical_or(invalid_error, other_sample[:, :, np.newaxis])] = np.nan
+    return errors
+
+
+def mean_error(errors):
+    """
+    Mean of 'errors' along the joints axis, the last one, ignoring NaN errors. NaN where
+    no joint has an error, without the warning of 'np.nanmean'.
+    """
+    valid = ~np.isnan(errors)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(valid, errors, 0.0).sum(axis=-1) / valid.sum(axis=-1)
+
+
 def zip_groups(combs):
     return map(list, (map(lambda x: zip(*x), combs)))
 
@@ -42,4 +129,24 @@ def possible_groups(gt_its, exp_its):
     n_pairs = min(len(exp_its), len(gt_its))
     gt_it_combs = combinations(gt_its, n_pairs)
     exp_it_perms = permutations(exp_its, n_pairs)
-    return list(zip_groups(product(gt_it_combs, exp_it_perms)))
\ No newline at end of file
+    return list(zip_groups(product(gt_it_combs, exp_it_perms)))
+
+
+def optimal_group(gt_its, exp_its, cost):
+    """
+    Group of (gt, exp) pairs with minimum total cost, the same group the minimum over
+    'possible_groups' gives, found by an optimal assignment. 'cost' is a matrix with a
+    row for each of 'gt_its' and a column for each of 'exp_its'. NaN costs, from pairs
+    without valid joints in common, are taken as larger than any other.
+    """
+    cost = np.asarray(cost, dtype=np.float64).reshape(len(gt_its), len(exp_its))
+    if cost.size == 0:
+        return []
+
+    nan_cost = np.isnan(cost)
+    if nan_cost.any():
+        finite_cost = np.abs(cost[~nan_cost]).max() if (~nan_cost).any() else 0.0
+        cost = np.where(nan_cost, 1.0 + min(cost.shape) * (finite_cost + 1.0), cost)
+
+    rows, columns = linear_sum_assignment(cost)
+    return [(gt_its[row], exp_its[column]) for row, column in zip(rows, columns)]
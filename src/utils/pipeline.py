@@ -0,0 +1,136 @@
+import time
+import numpy as np
+from queue import Queue, Full
+from threading import Thread, Event
+from src.utils.shared_memory import FrameRingBuffer
+
+
+class StageMeter:
+    def __init__(self):
+        self._n_items = 0
+        self._busy_time = 0.0
+
+    def add(self, elapsed, n_items=1):
+        self._n_items += n_items
+        self._busy_time += elapsed
+
+    def n_items(self):
+        return self._n_items
+
+    def fps(self):
+        return self._n_items / self._busy_time if self._busy_time > 0.0 else 0.0
+
+
+class FramePipeline:
+    """
+    Decodes frames from 'frames', an iterator of (sample_id, frame) pairs, on a background
+    thread and encodes them on 'pool', a 'src.utils.encoding.EncodingPool' that can be shared
+    between pipelines. Encoded payloads are kept on a queue of at most 'depth' frames and are
+    returned as (sample_id, payload) pairs following the original order when iterating over
+    the pipeline. When 'pool' runs on processes, decoded frames are handed to it through a
+    'FrameRingBuffer' instead of being pickled. Frames replaced by None, i.e. not to be
+    sent, aren't encoded and are returned as (sample_id, None).
+    """
+
+    _END = object()
+
+    def __init__(self, frames, pool, depth=32):
+        self._frames = frames
+        self._pool = pool
+        self._queue = Queue(maxsize=max(depth, 1))
+        self._ring = None
+
+        self._stop = Event()
+        self._thread = Thread(target=self._produce, name='FrameDecoder', daemon=True)
+
+        self._decode_meter = StageMeter()
+        self._encode_meter = StageMeter()
+        self._started_at = None
+        self._finished_at = None
+
+    def start(self):
+        self._started_at = time.time()
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self._queue.get()
+        if item is self._END:
+            self._finished_at = time.time()
+            self.close()
+            raise StopIteration()
+        if isinstance(item, Exception):
+            self.close()
+            raise item
+
+        sample_id, future = item
+        if future is None:
+            return sample_id, None
+        try:
+            payload, elapsed = future.result()
+        except Exception:
+            self.close()
+            raise
+        self._encode_meter.add(elapsed)
+        return sample_id, payload
+
+    def stats(self):
+        finished_at = self._finished_at or time.time()
+        wall_time = finished_at - (self._started_at or finished_at)
+        n_frames = self._encode_meter.n_items()
+        return {
+            'decode_fps': self._decode_meter.fps(),
+            'encode_fps': self._encode_meter.fps() * self._pool.workers(),
+            'pipeline_fps': n_frames / wall_time if wall_time > 0.0 else 0.0,
+        }
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _to_shared_memory(self, frame):
+        if self._ring is None:
+            # enough slots to all frames waiting on the queue and being encoded
+            n_slots = self._queue.maxsize + self._pool.workers() + 1
+            self._ring = FrameRingBuffer(n_slots=n_slots, shape=frame.shape)
+        return self._ring.write(frame)
+
+    def _produce(self):
+        try:
+            while not self._stop.is_set():
+                started_at = time.time()
+                try:
+                    sample_id, frame = next(self._frames)
+                except StopIteration:
+                    break
+                self._decode_meter.add(time.time() - started_at)
+
+                if frame is None:
+                    if not self._put((sample_id, None)):
+                        return
+                    continue
+                if self._pool.processes() and isinstance(frame, np.ndarray):
+                    frame = self._to_shared_memory(frame)
+                future = self._pool.submit(frame)
+                if not self._put((sample_id, future)):
+                    return
+        except Exception as ex:
+            self._put(ex)
+            return
+        self._put(self._END)
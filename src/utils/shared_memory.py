@@ -0,0 +1,160 @@
+import os
+import numpy as np
+from threading import Lock
+from multiprocessing import Queue
+from multiprocessing.shared_memory import SharedMemory
+
+# shared memory blocks already attached by this process, by name. They're only detached
+# once unlinked by their owner, which happens after all of their frames were released.
+_attached = {}
+_attached_lock = Lock()
+
+
+def _is_unlinked(name):
+    # on Linux, POSIX shared memory blocks are files on '/dev/shm'
+    return os.path.isdir('/dev/shm') and not os.path.exists(os.path.join('/dev/shm', name))
+
+
+def _detach(name):
+    with _attached_lock:
+        shm = _attached.pop(name, None)
+    if shm is not None:
+        shm.close()
+
+
+def _attach(name):
+    with _attached_lock:
+        if name not in _attached:
+            # blocks whose owner closed them would stay mapped until this process exits
+            for unlinked in list(filter(_is_unlinked, _attached.keys())):
+                _attached.pop(unlinked).close()
+            _attached[name] = SharedMemory(name=name)
+        return _attached[name]
+
+
+class SharedFrame:
+    """
+    Reference to a frame stored on a slot of a 'FrameRingBuffer'. It can be sent to other
+    processes without copying the frame, which is accessed in place through 'array'. The
+    slot is owned by whoever received it from the ring buffer, and goes back to it on
+    'release'. Pickled copies can only read or write the frame.
+    """
+
+    def __init__(self, name, shape, slot, free_slots=None, ring=None):
+        self._name = name
+        self._shape = shape
+        self._slot = slot
+        self._free_slots = free_slots
+        self._ring = ring
+
+    def __getstate__(self):
+        return (self._name, self._shape, self._slot)
+
+    def __setstate__(self, state):
+        self._name, self._shape, self._slot = state
+        self._free_slots = None
+        self._ring = None
+
+    def slot(self):
+        return self._slot
+
+    def array(self):
+        n_slots_shape = (self._slot + 1, ) + tuple(self._shape)
+        slots = np.ndarray(n_slots_shape, dtype=np.uint8, buffer=_attach(self._name).buf)
+        return slots[self._slot]
+
+    def release(self):
+        if self._free_slots is None:
+            raise Exception("Only the owner of a shared frame can release it.")
+        self._free_slots.put(self._slot)
+        self._free_slots = None
+        if self._ring is not None:
+            self._ring._on_release()
+            self._ring = None
+
+
+def as_array(frame):
+    return frame.array() if isinstance(frame, SharedFrame) else frame
+
+
+class FrameRingBuffer:
+    """
+    Ring of 'n_slots' frames with 'shape' on shared memory. A writer takes ownership of a
+    free slot with 'acquire', writes the frame in place, and hands the returned
+    'SharedFrame' over to a reader, which releases the slot when it's done with the frame.
+    Must be passed to other processes when creating them. The process that created it
+    only unlinks the shared memory on 'close' once every frame it handed out is released.
+    """
+
+    def __init__(self, n_slots, shape):
+        self._n_slots = n_slots
+        self._shape = tuple(shape)
+        self._shm = SharedMemory(create=True, size=int(n_slots * np.prod(self._shape)))
+        self._name = self._shm.name
+        # forked processes also get a copy of this object, but must not unlink it
+        self._owner_pid = os.getpid()
+        # frames handed out by this process and not released yet
+        self._n_frames_out = 0
+        self._closing = False
+        self._lock = Lock()
+
+        self._free_slots = Queue()
+        for slot in range(n_slots):
+            self._free_slots.put(slot)
+
+    def __getstate__(self):
+        return (self._n_slots, self._shape, self._name, self._free_slots)
+
+    def __setstate__(self, state):
+        self._n_slots, self._shape, self._name, self._free_slots = state
+        self._shm = None
+        self._owner_pid = None
+        self._n_frames_out = 0
+        self._closing = False
+        self._lock = Lock()
+
+    def n_slots(self):
+        return self._n_slots
+
+    def shape(self):
+        return self._shape
+
+    def acquire(self, timeout=None):
+        slot = self._free_slots.get(timeout=timeout)
+        return self._hand_out(slot)
+
+    def frame(self, slot):
+        # 'slot' came from another process, the current one will own it after that.
+        return self._hand_out(slot)
+
+    def write(self, frame, timeout=None):
+        shared_frame = self.acquire(timeout=timeout)
+        shared_frame.array()[...] = frame
+        return shared_frame
+
+    def close(self):
+        if self._owner_pid != os.getpid():
+            _detach(self._name)
+            return
+        with self._lock:
+            self._closing = True
+            if self._n_frames_out == 0:
+                self._unlink()
+
+    def _hand_out(self, slot):
+        with self._lock:
+            self._n_frames_out += 1
+        return SharedFrame(self._name, self._shape, slot, self._free_slots, ring=self)
+
+    def _on_release(self):
+        with self._lock:
+            self._n_frames_out -= 1
+            if self._closing and self._n_frames_out == 0:
+                self._unlink()
+
+    def _unlink(self):
+        _detach(self._name)
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
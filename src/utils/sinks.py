@@ -0,0 +1,299 @@
+import os
+import re
+import heapq
+from glob import glob
+import numpy as np
+import pandas as pd
+from src.utils.subsampling import interpolate_detections
+
+
+class ReorderBuffer:
+    def __init__(self, first_id, skip=None):
+        self._next_id = first_id
+        self._pending = {}
+        # keys that will never be pushed, e.g. already processed
+        self._skip = set(skip or [])
+
+    def __len__(self):
+        return len(self._pending)
+
+    def push(self, key, value):
+        """
+        Store 'value' received for 'key' and return a list of (key, value) pairs that
+        can be released following the keys order, i.e., without gaps since last release.
+        """
+        self._pending[key] = value
+        ready = []
+        while True:
+            if self._next_id in self._pending:
+                ready.append((self._next_id, self._pending.pop(self._next_id)))
+            elif self._next_id in self._skip:
+                self._skip.discard(self._next_id)
+            else:
+                break
+            self._next_id += 1
+        return ready
+
+    def drain(self):
+        ready = sorted(self._pending.items(), key=lambda x: x[0])
+        self._pending = {}
+        if len(ready) > 0:
+            self._next_id = ready[-1][0] + 1
+        return ready
+
+
+def _done_file_path(file_path):
+    return '{}.done'.format(file_path)
+
+
+def _part_files(file_path):
+    pattern = re.compile(r'^{}\.([0-9]+)\.part$'.format(re.escape(file_path)))
+    parts = filter(lambda x: pattern.match(x) is not None, glob('{}.*.part'.format(file_path)))
+    return sorted(parts, key=lambda x: int(pattern.match(x).groups()[0]))
+
+
+def _complete_lines(file_path):
+    # a last line without its line break was torn by a crash while being written
+    with open(file_path, 'r') as f:
+        for line in f:
+            if line.endswith('\n'):
+                yield line
+
+
+def _keep_lines(file_path, keep):
+    # rewrites a file with its complete lines for which 'keep(index, line)' is True
+    tmp_file_path = '{}.tmp'.format(file_path)
+    with open(tmp_file_path, 'w') as output:
+        output.writelines(line for index, line in enumerate(_complete_lines(file_path))
+                          if keep(index, line))
+    os.replace(tmp_file_path, file_path)
+
+
+def completed_sample_ids(file_path):
+    """
+    Sample ids already written on checkpoints of a 'CsvSink' that didn't finish.
+    """
+    done_file_path = _done_file_path(file_path)
+    if not os.path.exists(done_file_path):
+        return set()
+    return set(int(line) for line in _complete_lines(done_file_path) if line.strip() != '')
+
+
+def _discard_unfinished(file_path, done):
+    """
+    Drops, from the checkpoints of a 'CsvSink' that didn't finish, rows of samples not on
+    'done' and torn lines, i.e. the ones written right before a crash.
+    """
+    done_file_path = _done_file_path(file_path)
+    if os.path.exists(done_file_path):
+        _keep_lines(done_file_path, lambda index, line: True)
+
+    def is_done(index, line):
+        # the first line of a part is its header
+        return index == 0 or int(float(line.split(',', 1)[0])) in done
+
+    for part in _part_files(file_path):
+        _keep_lines(part, is_done)
+
+
+def is_complete(file_path):
+    return os.path.exists(file_path) and not os.path.exists(_done_file_path(file_path))
+
+
+def _merge_parts(file_path, parts):
+    files = [open(part, 'r') for part in parts]
+    header = None
+    for f in files:
+        header = f.readline() or header
+
+    def key(line):
+        values = line.split(',', 2)
+        return (float(values[0]), float(values[1]))
+
+    # each part is already sorted, so they're merged without loading them
+    tmp_file_path = '{}.tmp'.format(file_path)
+    with open(tmp_file_path, 'w') as output:
+        output.write(header or '')
+        output.writelines(heapq.merge(*files, key=key))
+    for f in files:
+        f.close()
+    os.replace(tmp_file_path, file_path)
+
+
+class CsvSink:
+    """
+    Incrementally writes annotations arrays, with 'sample_id' and 'person_id' on its
+    first two columns, to a CSV file. Samples can be received out of order, they're kept
+    on a reorder buffer and written sorted by 'sample_id' and 'person_id', producing the
+    same file as sorting all annotations at the end.
+
+    With 'checkpoint', rows are written to a part file and, once it's synced to disk, the
+    ids of written samples to a '.done' file, on every flush. Creating the sink with
+    'resume' keeps the parts of a previous run, without rows of samples not on '.done', and
+    skips samples already done. All parts are merged on 'close'.
+    """
+
+    def __init__(self, file_path, columns, first_sample_id, flush_every=50, checkpoint=False,
+                 resume=False):
+        self._file_path = file_path
+        self._columns = columns
+        self._flush_every = flush_every
+        self._checkpoint = checkpoint or resume
+
+        done = completed_sample_ids(file_path) if resume else set()
+        self._buffer = ReorderBuffer(first_sample_id, skip=done)
+        self._ready = []
+        self._ready_ids = []
+        self._n_written_samples = 0
+
+        if self._checkpoint:
+            if resume:
+                _discard_unfinished(file_path, done)
+            else:
+                self._remove_checkpoints()
+            part_file_path = '{}.{}.part'.format(file_path, len(_part_files(file_path)))
+            self._file = open(part_file_path, 'w')
+            self._done_file = open(_done_file_path(file_path), 'a')
+        else:
+            self._file = open(file_path, 'w')
+        self._write_header = True
+
+    def file_path(self):
+        return self._file_path
+
+    def n_written_samples(self):
+        return self._n_written_samples
+
+    def write(self, sample_id, data):
+        for ready_id, ready_data in self._buffer.push(sample_id, data):
+            self._append(ready_id, ready_data)
+
+        if len(self._ready_ids) >= self._flush_every:
+            self.flush()
+
+    def flush(self, force=False):
+        # forcing only matters to write the header of a file without annotations
+        if len(self._ready_ids) == 0 and not (force and self._write_header):
+            return
+
+        if len(self._ready) > 0:
+            data = np.vstack(self._ready)
+        else:
+            data = np.zeros((0, len(self._columns)))
+        df = pd.DataFrame(data=data, columns=self._columns)
+        df.to_csv(path_or_buf=self._file, header=self._write_header, index=False)
+        self._file.flush()
+
+        if self._checkpoint and len(self._ready_ids) > 0:
+            # samples are only marked as done once their rows can't be lost
+            os.fsync(self._file.fileno())
+            self._done_file.write(''.join('{}\n'.format(x) for x in self._ready_ids))
+            self._done_file.flush()
+
+        self._write_header = False
+        self._n_written_samples += len(self._ready_ids)
+        self._ready = []
+        self._ready_ids = []
+
+    def close(self):
+        for ready_id, ready_data in self._buffer.drain():
+            self._append(ready_id, ready_data)
+        self.flush(force=True)
+        self._file.close()
+
+        if self._checkpoint:
+            self._done_file.close()
+            _merge_parts(self._file_path, _part_files(self._file_path))
+            self._remove_checkpoints()
+
+    def _append(self, sample_id, data):
+        if data.shape[0] > 0:
+            self._ready.append(data[np.argsort(data[:, 1], kind='mergesort')])
+        self._ready_ids.append(int(sample_id))
+
+    def _remove_checkpoints(self):
+        for part in _part_files(self._file_path):
+            os.remove(part)
+        if os.path.exists(_done_file_path(self._file_path)):
+            os.remove(_done_file_path(self._file_path))
+
+
+class SubsampledSink:
+    """
+    Wraps a 'CsvSink' of a camera whose frames weren't all sent to the detector. Samples
+    marked with 'skip' take the detections of the last sent sample or, with 'interpolate',
+    the ones interpolated between the sent samples around them. Everything is written to
+    the wrapped sink in order, so it sees the same samples as a run sending all frames.
+    Samples with ids on 'cached' are written with detections served from a cache, and
+    aren't counted as detections on the stats.
+    """
+
+    def __init__(self, sink, first_sample_id, n_columns, interpolate=False, skip=None,
+                 cached=None):
+        self._sink = sink
+        self._buffer = ReorderBuffer(first_sample_id, skip=skip)
+        self._n_columns = n_columns
+        self._interpolate = interpolate
+        self._last = None
+        self._waiting = []
+        self._cached = set(cached or [])
+        self._n_sent, self._n_cached, self._n_skipped = 0, 0, 0
+
+    def file_path(self):
+        return self._sink.file_path()
+
+    def n_written_samples(self):
+        return self._sink.n_written_samples()
+
+    def stats(self):
+        n_samples = self._n_sent + self._n_cached + self._n_skipped
+        return {
+            'detections': self._n_sent,
+            'cached': self._n_cached,
+            'calls_saved': self._n_skipped,
+            'saved_ratio': self._n_skipped / n_samples if n_samples > 0 else 0.0,
+        }
+
+    def write(self, sample_id, data):
+        if sample_id in self._cached:
+            self._n_cached += 1
+        else:
+            self._n_sent += 1
+        self._release(self._buffer.push(sample_id, data))
+
+    def skip(self, sample_id):
+        self._n_skipped += 1
+        self._release(self._buffer.push(sample_id, None))
+
+    def close(self):
+        self._release(self._buffer.drain())
+        # no sent sample after these ones to interpolate with
+        for sample_id in self._waiting:
+            self._sink.write(sample_id, self._copy_last(sample_id))
+        self._waiting = []
+        self._sink.close()
+
+    def _release(self, ready):
+        for sample_id, data in ready:
+            if data is None:
+                if self._interpolate and self._last is not None:
+                    self._waiting.append(sample_id)
+                else:
+                    self._sink.write(sample_id, self._copy_last(sample_id))
+                continue
+
+            for waiting_id in self._waiting:
+                last_id, last_data = self._last
+                t = (waiting_id - last_id) / (sample_id - last_id)
+                self._sink.write(waiting_id,
+                                 interpolate_detections(last_data, data, t, waiting_id))
+            self._waiting = []
+            self._sink.write(sample_id, data)
+            self._last = (sample_id, data)
+
+    def _copy_last(self, sample_id):
+        if self._last is None:
+            return np.zeros((0, self._n_columns))
+        data = self._last[1].copy()
+        data[:, 0] = sample_id
+        return data
@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+from src.utils.shared_memory import SharedFrame, as_array
+from src.utils.metrics import shape_2d_data, valid_2d_joints, match_2d_skeletons
+
+
+def stride_frames(frames, stride, last_id=None):
+    """
+    Replaces by None all frames but one of every 'stride' ones, and the one with 'last_id',
+    so skipped frames can be interpolated between two sent ones.
+    """
+    first_id = None
+    for sample_id, frame in frames:
+        if first_id is None:
+            first_id = sample_id
+        if (sample_id - first_id) % stride == 0 or sample_id == last_id:
+            yield sample_id, frame
+        else:
+            if isinstance(frame, SharedFrame):
+                frame.release()
+            yield sample_id, None
+
+
+def skip_static_frames(frames, threshold, size=(64, 36)):
+    """
+    Replaces by None frames whose mean absolute difference, on a downsampled gray scale
+    image, from the last frame not replaced is below 'threshold'.
+    """
+    last_sent = None
+    for sample_id, frame in frames:
+        if frame is None:
+            yield sample_id, None
+            continue
+        image = as_array(frame)
+        small = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), size,
+                           interpolation=cv2.INTER_AREA).astype(np.float32)
+
+        if last_sent is not None and np.mean(np.abs(small - last_sent)) < threshold:
+            if isinstance(frame, SharedFrame):
+                frame.release()
+            yield sample_id, None
+        else:
+            last_sent = small
+            yield sample_id, frame
+
+
+def interpolate_detections(before, after, t, sample_id):
+    """
+    Linearly interpolates, at 't' from 0.0 to 1.0, detections arrays with 'sample_id' and
+    'person_id' on the first columns. Joints valid on only one of the matched skeletons,
+    and unmatched skeletons, are taken from the nearest detection.
+    """
+    pairs, _ = match_2d_skeletons(before, after)
+    nearest, nearest_index = (before, 0) if t < 0.5 else (after, 1)
+
+    rows = []
+    for pair in pairs:
+        row = nearest[pair[nearest_index]].copy()
+        joints = shape_2d_data(row[np.newaxis])[0]
+        joints_before = shape_2d_data(before[pair[0]][np.newaxis])[0]
+        joints_after = shape_2d_data(after[pair[1]][np.newaxis])[0]
+        both_valid = np.logical_and(valid_2d_joints(joints_before[np.newaxis])[0],
+                                    valid_2d_joints(joints_after[np.newaxis])[0])
+        joints[both_valid] = (1.0 - t) * joints_before[both_valid] + t * joints_after[both_valid]
+        rows.append(row)
+
+    matched = set(pair[nearest_index] for pair in pairs)
+    rows.extend(nearest[i] for i in range(nearest.shape[0]) if i not in matched)
+
+    if len(rows) == 0:
+        return np.zeros((0, before.shape[1]))
+    data = np.vstack(rows)
+    data[:, 0] = sample_id
+    return data
@@ -1,11 +1,22 @@
 import os
 import cv2
+import numpy as np
+from multiprocessing import Process, Queue
+from src.utils.shared_memory import FrameRingBuffer
 
 
 class VideoIterator:
-    def __init__(self, filename=None):
+    """
+    Iterates over frames of a video. Seeks farther than 'seek_threshold' frames ahead of the
+    current position, or backwards, are done through CAP_PROP_POS_FRAMES, which positions the
+    decoder on the nearest keyframe. Otherwise, frames are skipped with 'grab', that doesn't
+    decode them completely.
+    """
+
+    def __init__(self, filename=None, seek_threshold=50):
 
         self._filename = filename
+        self._seek_threshold = seek_threshold
         self._vc = cv2.VideoCapture(filename)
         if not self._vc.isOpened():
             raise Exception("Can't open video '{}'", filename)
@@ -34,15 +45,59 @@ class VideoIterator:
         self._begin = iter_range.start
         self._end = iter_range.stop
 
+        self.seek(self._begin)
+        return self
+
+    def position(self):
+        return int(self._vc.get(cv2.CAP_PROP_POS_FRAMES))
+
+    def seek(self, frame_id):
+        if frame_id < 0 or frame_id >= self._n_frames:
+            raise Exception("Frame {} is out of video with {} frames.".format(
+                frame_id, self._n_frames))
+
+        position = self.position()
+        if frame_id == position:
+            return
+
+        if position < frame_id <= position + self._seek_threshold:
+            self._skip(frame_id - position)
+            return
+
+        if self._vc.set(cv2.CAP_PROP_POS_FRAMES, frame_id):
+            # verify the position reached by the backend and advance if it stopped before
+            position = self.position()
+            if position == frame_id:
+                return
+            if 0 <= position < frame_id:
+                self._skip(frame_id - position)
+                return
+
+        # seeking isn't reliable on this video, decode it from the beginning
         self._vc = cv2.VideoCapture(self._filename)
-        # drop initial frames out of range
-        while True:
-            next_frame_id = int(self._vc.get(cv2.CAP_PROP_POS_FRAMES))
-            if next_frame_id == self._begin:
-                break
-            self._vc.read()
+        self._skip(frame_id)
 
-        return self
+    def frame_at(self, frame_id):
+        """
+        Returns the frame with 'frame_id'. Iteration continues from the frame after it.
+        """
+        self.seek(frame_id)
+        has_frame, frame = self._vc.read()
+        if not has_frame:
+            raise Exception("Can't read frame {} from '{}'.".format(frame_id, self._filename))
+        return frame
+
+    def frames(self, frame_ids):
+        """
+        Generator of (frame_id, frame) pairs following the order of 'frame_ids'.
+        """
+        for frame_id in frame_ids:
+            yield frame_id, self.frame_at(frame_id)
+
+    def _skip(self, n_frames):
+        for _ in range(n_frames):
+            if not self._vc.grab():
+                break
 
     def __iter__(self):
         return self
@@ -55,3 +110,225 @@ class VideoIterator:
 
         _, frame = self._vc.read()
         return frame
+
+
+def _decode_segment(filename, segment, index, ring, ready_frames, skip):
+    try:
+        video_iterator = VideoIterator(filename).in_range(segment)
+        if skip:
+            frames = video_iterator.frames(x for x in segment if x not in skip)
+        else:
+            frames = zip(segment, video_iterator)
+        for frame_id, frame in frames:
+            # frame count from the container can be greater than the decodable frames
+            if frame is None:
+                break
+            shared_frame = ring.write(frame)
+            ready_frames.put((index, frame_id, shared_frame.slot()))
+        ready_frames.put((index, None, None))
+    except Exception as ex:
+        ready_frames.put((index, None, str(ex)))
+    finally:
+        ring.close()
+
+
+class SegmentedVideoReader:
+    """
+    Splits 'iter_range' of a video into 'n_segments' contiguous segments, each one decoded
+    on its own process into a 'FrameRingBuffer' of 'n_slots' frames. Frames are returned as
+    (frame_id, frame) pairs, like zipping the range with a 'VideoIterator', where 'frame' is
+    a 'SharedFrame' that must be released after its use. If 'ordered' is False, frames are
+    returned as soon as they're decoded. Otherwise, each segment but the one being returned
+    decodes at most 'n_slots' frames ahead, so segments are effectively decoded one after
+    the other unless 'n_slots' is close to the segment length. Frames with ids on 'skip'
+    aren't returned, and decoders seek over them.
+    """
+
+    def __init__(self, filename, iter_range=None, n_segments=2, n_slots=4, ordered=True,
+                 skip=None):
+        video_iterator = VideoIterator(filename)
+        self._fps = video_iterator.fps()
+        self._resolution = video_iterator.resolution()
+        self._n_frames = video_iterator.n_frames()
+        del video_iterator
+
+        if iter_range is None:
+            iter_range = range(0, self._n_frames)
+        iter_range = range(iter_range.start, min(iter_range.stop, self._n_frames))
+        if len(iter_range) == 0:
+            raise Exception("Range of frames doesn't have any frame of the video.")
+
+        n_segments = max(1, min(n_segments, len(iter_range)))
+        bounds = np.linspace(iter_range.start, iter_range.stop, n_segments + 1).astype(int)
+        self._segments = [range(b, e) for b, e in zip(bounds[:-1], bounds[1:])]
+        self._ordered = ordered
+
+        width, height = self._resolution
+        shared_ready = None if ordered else Queue()
+
+        self._rings, self._ready, self._processes = [], [], []
+        for index, segment in enumerate(self._segments):
+            ring = FrameRingBuffer(n_slots=n_slots, shape=(height, width, 3))
+            ready_frames = shared_ready or Queue()
+            process = Process(
+                target=_decode_segment,
+                args=(filename, segment, index, ring, ready_frames, skip),
+                daemon=True)
+
+            self._rings.append(ring)
+            self._ready.append(ready_frames)
+            self._processes.append(process)
+
+        for process in self._processes:
+            process.start()
+
+        self._current = 0
+        self._n_finished = 0
+
+    def fps(self):
+        return self._fps
+
+    def resolution(self):
+        return self._resolution
+
+    def n_frames(self):
+        return self._n_frames
+
+    def segments(self):
+        return self._segments
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while self._n_finished < len(self._segments):
+            ready_frames = self._ready[self._current if self._ordered else 0]
+            index, frame_id, slot = ready_frames.get()
+
+            if frame_id is None:
+                if slot is not None:
+                    self.close()
+                    raise Exception("Failed to decode segment {}: {}".format(index, slot))
+                self._n_finished += 1
+                self._current += 1
+                continue
+
+            return frame_id, self._rings[index].frame(slot)
+
+        self.close()
+        raise StopIteration()
+
+    def close(self):
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self._processes = []
+
+        for ring in self._rings:
+            ring.close()
+        self._rings = []
+
+
+class MultiVideoIterator:
+    """
+    Iterates over videos of several cameras at once, returning (frame_id, {camera_id: frame})
+    bundles with the frames of all cameras with the same id. 'videos' maps camera ids to video
+    files, each one decoded on its own process at most 'lookahead' frames ahead. Cameras
+    whose video ends before 'iter_range' are left out of the following bundles. Frames are
+    'SharedFrame's and callers must release each one after its use, directly or through
+    'release'. They stay valid until then, even after their camera ended, since a closed
+    reader only frees its shared memory once all of its frames are released.
+    """
+
+    def __init__(self, videos, iter_range=None, lookahead=8):
+        self._readers = {}
+        for camera_id, filename in sorted(videos.items()):
+            n_frames = VideoIterator(filename).n_frames()
+            camera_range = iter_range if iter_range is not None else range(0, n_frames)
+            if camera_range.start >= min(camera_range.stop, n_frames):
+                continue
+            self._readers[camera_id] = SegmentedVideoReader(
+                filename, iter_range=camera_range, n_segments=1, n_slots=max(lookahead, 1))
+
+        if len(self._readers) == 0:
+            raise Exception("Range of frames doesn't have any frame of the videos.")
+
+        self._resolutions = {
+            camera_id: reader.resolution()
+            for camera_id, reader in self._readers.items()
+        }
+        # next frame of each camera, read ahead to align the bundles
+        self._heads = {}
+        self._to_advance = list(self._readers.keys())
+
+    def cameras(self):
+        return list(self._resolutions.keys())
+
+    def resolutions(self):
+        return self._resolutions
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        # readers are only advanced here, as they're closed when reaching the end, which
+        # doesn't invalidate their frames still held by the caller
+        for camera_id in self._to_advance:
+            self._advance(camera_id)
+
+        if len(self._heads) == 0:
+            self.close()
+            raise StopIteration()
+
+        frame_id = min(frame_id for frame_id, _ in self._heads.values())
+        bundle = {}
+        for camera_id in sorted(self._heads.keys()):
+            head_id, frame = self._heads[camera_id]
+            if head_id == frame_id:
+                bundle[camera_id] = frame
+        self._to_advance = list(bundle.keys())
+        return frame_id, bundle
+
+    @staticmethod
+    def release(bundle):
+        for frame in bundle.values():
+            frame.release()
+
+    def close(self):
+        for reader in self._readers.values():
+            reader.close()
+        self._readers = {}
+        self._heads = {}
+        self._to_advance = []
+
+    def _advance(self, camera_id):
+        try:
+            self._heads[camera_id] = next(self._readers[camera_id])
+        except StopIteration:
+            self._heads.pop(camera_id, None)
+        except Exception:
+            self.close()
+            raise
+
+
+def video_frames(filename, iter_range, n_segments=1, ordered=True, skip=None):
+    """
+    Returns (frame_id, frame) pairs of 'iter_range' from a video, decoded on 'n_segments'
+    processes if more than one, and the video resolution. Segments are only decoded in
+    parallel if frames can be returned out of order, i.e. 'ordered' is False. Frames with
+    ids on 'skip' aren't decoded.
+    """
+    if len(iter_range) == 0:
+        return iter([]), VideoIterator(filename).resolution()
+    if n_segments > 1:
+        reader = SegmentedVideoReader(
+            filename, iter_range=iter_range, n_segments=n_segments, ordered=ordered, skip=skip)
+        return reader, reader.resolution()
+    video_iterator = VideoIterator(filename)
+    if skip:
+        # stops at the end of the video, as when iterating over it
+        frame_ids = range(iter_range.start, min(iter_range.stop, video_iterator.n_frames()))
+        frames = video_iterator.in_range(iter_range).frames(x for x in frame_ids if x not in skip)
+        return frames, video_iterator.resolution()
+    return zip(iter_range, video_iterator.in_range(iter_range)), video_iterator.resolution()